@@ -0,0 +1,65 @@
+/*
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+*/
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.FileInputStream;
+import java.io.InputStreamReader;
+import java.io.IOException;
+import java.io.ObjectInputStream;
+import java.io.PrintStream;
+
+import org.scilab.modules.types.ScilabList;
+
+/*
+    Long-running replacement for Extractor.
+
+    Each request is one line on stdin: the path to dictionary.ser followed by
+    the requested positions, separated by tabs. The worker deserializes the
+    dictionary once per request and answers with one line per position,
+    followed by a line containing a single dot.
+*/
+public class ExtractorWorker {
+    public static void main(String[] args) throws IOException {
+        BufferedReader input = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        PrintStream output = new PrintStream(new BufferedOutputStream(System.out), false, "UTF-8");
+        String line;
+        while ((line = input.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            String[] request = line.split("\t");
+            try (ObjectInputStream objectInputStream = new ObjectInputStream(
+                    new BufferedInputStream(new FileInputStream(request[0])))) {
+                ScilabList list = (ScilabList) objectInputStream.readObject();
+                for (int i = 1; i < request.length; i++) {
+                    Object value = list.get(Integer.valueOf(request[i]));
+                    output.println(String.valueOf(value).replace('\n', ' '));
+                }
+            } catch (Exception e) {
+                output.println("ERROR " + String.valueOf(e).replace('\n', ' '));
+            }
+            output.println(".");
+            output.flush();
+        }
+    }
+}
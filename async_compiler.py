@@ -0,0 +1,103 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import os
+
+from extractor import ExtractorWorker
+from parser import Parser
+from template_builder import CORES_DIR, TemplateBuilder
+import utils
+
+adder_optimization = False
+gain_folding = True
+cores_dir = CORES_DIR
+extractor = None
+
+
+def init_worker(
+    enable_adder_optimization: bool,
+    use_jvm: bool,
+    log_level: int,
+    core_library_dir=CORES_DIR,
+    enable_gain_folding=True
+):
+    global adder_optimization, gain_folding, cores_dir, extractor
+    utils.set_log_level(log_level)
+    adder_optimization = enable_adder_optimization
+    gain_folding = enable_gain_folding
+    cores_dir = core_library_dir
+    if use_jvm:
+        extractor = ExtractorWorker()
+
+
+def compile_model(model_bytes: bytes, template: str) -> str:
+    parser = Parser(model_bytes, adder_optimization, extractor, enable_gain_folding=gain_folding)
+    builder = TemplateBuilder(template, cores_dir)
+    builder.build(parser)
+    sink = io.StringIO()
+    builder.write(sink)
+    return sink.getvalue()
+
+
+def read_model(model_file: str) -> bytes:
+    with open(model_file, 'rb') as file:
+        return file.read()
+
+
+class AsyncCompiler:
+    def __init__(
+        self,
+        template='default.template',
+        jobs=None,
+        enable_adder_optimization=False,
+        use_jvm=False,
+        cores_dir=CORES_DIR,
+        enable_gain_folding=True
+    ):
+        self.template = template
+        self.jobs = jobs or os.cpu_count()
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=init_worker,
+            initargs=(enable_adder_optimization, use_jvm, utils.log_level, cores_dir, enable_gain_folding)
+        )
+        self.slots = asyncio.Semaphore(self.jobs * 2)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def compile(self, model_bytes: bytes, template=None) -> str:
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, compile_model, model_bytes, template or self.template)
+
+    async def compile_file(self, model_file: str, template=None) -> str:
+        model_bytes = await asyncio.to_thread(read_model, model_file)
+        return await self.compile(model_bytes, template)
+
+    async def close(self):
+        await asyncio.to_thread(self.executor.shutdown)
@@ -0,0 +1,207 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import os
+import sys
+
+from build_cache import BuildCache, CACHE_DIR
+from build_report import BuildReport
+from bundle import Bundle, get_instances
+from errors import GeneratorError
+from extractor import ExtractorWorker
+from parser import Parser
+from template_builder import CORES_DIR, TemplateBuilder
+import utils
+
+logger = utils.get_logger('batch')
+
+prototype = None
+adder_optimization = False
+gain_folding = True
+extractor = None
+cache = None
+
+
+def init_worker(
+    builder: TemplateBuilder,
+    enable_adder_optimization: bool,
+    use_jvm: bool,
+    build_cache: BuildCache,
+    log_level: int,
+    enable_gain_folding=True
+):
+    global prototype, adder_optimization, gain_folding, extractor, cache
+    utils.set_log_level(log_level)
+    prototype = builder
+    adder_optimization = enable_adder_optimization
+    gain_folding = enable_gain_folding
+    cache = build_cache
+    if use_jvm:
+        extractor = ExtractorWorker()
+
+
+def compile_model(model_file: str, output_file: str, report_file: str = None, bundle_dir: str = None) -> tuple:
+    report = BuildReport(model_file)
+    builder = prototype
+    try:
+        key = cache.key(model_file, prototype.sources, adder_optimization, gain_folding) if cache else None
+        if key and cache.fetch(key, output_file):
+            report.cached = True
+        else:
+            parser = Parser(model_file, adder_optimization, extractor, report, gain_folding)
+            builder = prototype.clone()
+            builder.build(parser)
+            with open(output_file, 'w') as file:
+                builder.write(file)
+            if key:
+                cache.store(key, output_file)
+        if bundle_dir:
+            instances = get_instances(output_file) if report.cached else None
+            Bundle(bundle_dir).write(output_file, builder.get_core_sources(instances))
+        if report_file:
+            report.save(report_file)
+    except GeneratorError as e:
+        return model_file, False, str(e)
+    except Exception as e:
+        return model_file, False, '{0}: {1}'.format(type(e).__name__, e)
+    return model_file, True, output_file
+
+
+def find_models(patterns: list) -> list:
+    models = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.warning("Не найдено моделей по шаблону: {0}".format(pattern))
+        for model in matches:
+            if model not in models:
+                models.append(model)
+    return models
+
+
+def get_output_file(model_file: str, output_dir: str, suffix: str = '.v') -> str:
+    name = os.path.splitext(os.path.basename(model_file))[0] + suffix
+    return os.path.join(output_dir or os.path.dirname(model_file), name)
+
+
+def find_collisions(models: list, output_dir: str, suffix: str = '.v') -> dict:
+    targets = {}
+    for model in models:
+        target = os.path.normcase(os.path.abspath(get_output_file(model, output_dir, suffix)))
+        targets.setdefault(target, []).append(model)
+    return {target: sources for target, sources in targets.items() if len(sources) > 1}
+
+
+def main(args=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Пакетная сборка HDL из моделей Xcos")
+    arg_parser.add_argument('models', nargs='+', help="файлы .zcos или glob-шаблоны")
+    arg_parser.add_argument('-t', '--template', default='default.template', help="файл шаблона")
+    arg_parser.add_argument('--cores-dir', default=CORES_DIR, help="каталог библиотеки ядер HDL")
+    arg_parser.add_argument('-o', '--output-dir', default=None, help="каталог для файлов .v")
+    arg_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="число процессов")
+    arg_parser.add_argument('--adder-optimization', action='store_true', help="объединять каскады сумматоров")
+    arg_parser.add_argument('--no-gain-folding', action='store_true', help="не сворачивать цепочки коэффициентов усиления")
+    arg_parser.add_argument('--jvm', action='store_true', help="извлекать коэффициенты через ExtractorWorker")
+    arg_parser.add_argument('--bundle', default=None, help="общий каталог для файлов .v и исходных файлов ядер")
+    arg_parser.add_argument('--report-dir', default=None, help="каталог для отчётов о сборке в формате JSON")
+    arg_parser.add_argument('--no-cache', action='store_true', help="не использовать кэш сборки")
+    arg_parser.add_argument('--clear-cache', action='store_true', help="очистить кэш сборки")
+    arg_parser.add_argument('--cache-dir', default=CACHE_DIR, help="каталог кэша сборки")
+    arg_parser.add_argument('-q', '--quiet', action='store_true', help="выводить только предупреждения и ошибки")
+    arg_parser.add_argument('--log-level', choices=sorted(utils.log_levels), default='debug', help="уровень журнала")
+    options = arg_parser.parse_args(args)
+    utils.set_log_level('warning' if options.quiet else options.log_level)
+
+    logger.info("xcos-gen, версия {0}, разработчик {1}".format(
+        utils.__version__,
+        utils.__author__
+    ))
+    models = find_models(options.models)
+    if not models:
+        logger.error("Не найдено ни одной модели")
+        return 1
+    if options.bundle:
+        options.output_dir = options.bundle
+    collisions = find_collisions(models, options.output_dir)
+    if options.report_dir:
+        collisions.update(find_collisions(models, options.report_dir, '.json'))
+    if collisions:
+        for target, sources in sorted(collisions.items()):
+            logger.error("Модели {0} записываются в один файл {1}".format(', '.join(sources), target))
+        return 1
+    if options.output_dir:
+        os.makedirs(options.output_dir, exist_ok=True)
+    if options.report_dir:
+        os.makedirs(options.report_dir, exist_ok=True)
+    build_cache = BuildCache(options.cache_dir)
+    if options.clear_cache:
+        build_cache.clear()
+    try:
+        builder = TemplateBuilder(options.template, options.cores_dir)
+    except GeneratorError as e:
+        logger.error(e)
+        return 1
+    jobs = max(1, min(options.jobs or 1, len(models)))
+    logger.info(utils.separator)
+    logger.info("Сборка {0} моделей в {1} процессах".format(len(models), jobs))
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_worker,
+        initargs=(
+            builder,
+            options.adder_optimization,
+            options.jvm,
+            None if options.no_cache else build_cache,
+            utils.log_level,
+            not options.no_gain_folding
+        )
+    ) as executor:
+        futures = {
+            executor.submit(
+                compile_model,
+                model,
+                get_output_file(model, options.output_dir),
+                get_output_file(model, options.report_dir, '.json') if options.report_dir else None,
+                options.bundle
+            ): model
+            for model in models
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                model, success, message = future.result()
+            except Exception as e:
+                model, success, message = futures[future], False, str(e) or type(e).__name__
+            if success:
+                logger.info("Готово: {0} -> {1}".format(model, message))
+            else:
+                failed += 1
+                logger.error("Ошибка: {0}: {1}".format(model, message))
+    logger.info(utils.separator)
+    logger.info("Собрано моделей: {0}, с ошибками: {1}".format(len(models) - failed, failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from build_report import BuildReport
+from model_generator import ModelGenerator, TOPOLOGIES
+from parser import Parser
+from template_builder import TemplateBuilder
+import utils
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+logger = utils.get_logger('benchmark')
+
+
+def run_build(model_file: str, prototype: TemplateBuilder, adder_optimization: bool) -> BuildReport:
+    report = BuildReport(model_file)
+    parser = Parser(model_file, adder_optimization, report=report)
+    builder = prototype.clone()
+    builder.build(parser)
+    with open(os.devnull, 'w') as file:
+        builder.write(file)
+    return report
+
+
+def measure(model_file: str, prototype: TemplateBuilder, adder_optimization: bool, trace_memory: bool) -> dict:
+    result = run_build(model_file, prototype, adder_optimization).to_dict()
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            result['memory'] = run_build(model_file, prototype, adder_optimization).memory
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def print_result(result: dict):
+    logger.info("{0} / {1} блоков: {2:.3f} с".format(result['topology'], result['size'], result['total']))
+    for name, value in result['phases'].items():
+        memory = result['memory'].get(name)
+        logger.info("    {0:<18} {1:>10.4f} с{2}".format(
+            name,
+            value,
+            ', пик {0:.1f} МБ'.format(memory / 1024 / 1024) if memory is not None else ''
+        ))
+
+
+def main(args=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Замеры производительности xcos-gen на синтетических моделях")
+    arg_parser.add_argument('-s', '--sizes', type=int, nargs='+', default=SIZES, help="размеры моделей в блоках")
+    arg_parser.add_argument('--topology', choices=TOPOLOGIES, nargs='+', default=TOPOLOGIES, help="топологии моделей")
+    arg_parser.add_argument('-t', '--template', default='default.template', help="файл шаблона")
+    arg_parser.add_argument('--seed', type=int, default=0, help="начальное значение генератора случайных чисел")
+    arg_parser.add_argument('--adder-optimization', action='store_true', help="объединять каскады сумматоров")
+    arg_parser.add_argument('--no-memory', action='store_true', help="не измерять пиковое потребление памяти")
+    arg_parser.add_argument('-o', '--output', help="сохранить результаты в формате JSON")
+    arg_parser.add_argument('--log-level', choices=sorted(utils.log_levels), default='warning', help="уровень журнала")
+    options = arg_parser.parse_args(args)
+    utils.set_log_level(options.log_level)
+    logger.setLevel(min(utils.log_level, logging.INFO))
+
+    prototype = TemplateBuilder(options.template)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='xcos-gen-') as directory:
+        for topology in options.topology:
+            for size in options.sizes:
+                generator = ModelGenerator(seed=options.seed)
+                generator.generate(topology, size)
+                model_file = os.path.join(directory, '{0}_{1}.zcos'.format(topology, size))
+                generator.write(model_file)
+                result = measure(model_file, prototype, options.adder_optimization, not options.no_memory)
+                result.update({
+                    'topology': topology,
+                    'size': len(generator)
+                })
+                print_result(result)
+                results.append(result)
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+            file.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
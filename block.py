@@ -27,10 +27,29 @@ class Block:
         self.inputs = set()
         self.outputs = set()
         self.gain = None
+        self.port = None
+        self.subsystem = None
+        self.input_ports = {}
+        self.output_ports = {}
 
-    def connect(self, block):
+    def connect(self, block, output_port=1, input_port=1):
         block.inputs.add(self.block_id)
         self.outputs.add(block.block_id)
+        if output_port != 1:
+            self.output_ports[block.block_id] = output_port
+        if input_port != 1:
+            block.input_ports[self.block_id] = input_port
+
+    def disconnect(self, block) -> tuple:
+        block.inputs.remove(self.block_id)
+        self.outputs.remove(block.block_id)
+        return self.output_ports.pop(block.block_id, 1), block.input_ports.pop(self.block_id, 1)
+
+    def get_output_port(self, block_id: str) -> int:
+        return self.output_ports.get(block_id, 1)
+
+    def get_input_port(self, block_id: str) -> int:
+        return self.input_ports.get(block_id, 1)
 
     def __str__(self):
         if not self.gain:
@@ -0,0 +1,135 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import utils
+
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'xcos-gen'
+)
+MAX_SIZE = 100 * 1024 * 1024
+MAX_AGE = 30 * 24 * 60 * 60
+CHUNK_SIZE = 1024 * 1024
+
+
+class BuildCache:
+    suffix = '.v'
+
+    def __init__(self, directory=CACHE_DIR, max_size=MAX_SIZE, max_age=MAX_AGE):
+        self.logger = utils.get_logger(__name__)
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+
+    @staticmethod
+    def key(model_file: str, sources: list, *options) -> str:
+        digest = hashlib.sha256()
+        digest.update(utils.__version__.encode())
+        for option in options:
+            digest.update(b'\0' + repr(option).encode())
+        for filename in [model_file] + list(sources):
+            with open(filename, 'rb') as file:
+                digest.update('\0{0}\0'.format(os.fstat(file.fileno()).st_size).encode())
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def fetch(self, key: str, output_file: str) -> bool:
+        path = self.get_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                self.remove(path)
+                return False
+            shutil.copyfile(path, output_file)
+            os.utime(path)
+        except OSError:
+            return False
+        self.logger.info("Найден результат в кэше сборки: {0}".format(key))
+        return True
+
+    def store(self, key: str, output_file: str):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            os.close(handle)
+        except OSError as e:
+            self.logger.warning("Не удалось сохранить результат в кэш сборки: {0}".format(e))
+            return
+        try:
+            shutil.copyfile(output_file, temp_path)
+            os.replace(temp_path, self.get_path(key))
+        except OSError as e:
+            self.logger.warning("Не удалось сохранить результат в кэш сборки: {0}".format(e))
+            self.remove(temp_path)
+            return
+        self.evict()
+
+    def entries(self) -> list:
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for mtime, size, path in self.entries():
+            if now - mtime > self.max_age:
+                self.remove(path)
+            else:
+                entries.append((mtime, size, path))
+        total = sum(x[1] for x in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    def clear(self):
+        entries = self.entries()
+        for _, _, path in entries:
+            self.remove(path)
+        self.logger.info("Кэш сборки очищен, удалено записей: {0}".format(len(entries)))
+
+    @staticmethod
+    def remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
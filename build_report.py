@@ -0,0 +1,98 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import contextlib
+import datetime
+import json
+import time
+import tracemalloc
+
+import utils
+
+
+class BuildReport:
+    def __init__(self, model_file=None):
+        self.model_file = model_file
+        self.created = datetime.datetime.now()
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.memory = {}
+        self.stack = []
+        self.counts = {}
+        self.instances = {}
+        self.cached = False
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        frame = [name, 0.0, 0]
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            self.update_peak()
+            tracemalloc.reset_peak()
+        self.stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            spent = time.perf_counter() - started
+            if tracing:
+                self.update_peak()
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1][1] += spent
+                self.stack[-1][2] = max(self.stack[-1][2], frame[2])
+            self.phases[name] = self.phases.get(name, 0.0) + spent - frame[1]
+            if tracing:
+                self.memory[name] = max(self.memory.get(name, 0), frame[2])
+
+    def update_peak(self):
+        if self.stack:
+            self.stack[-1][2] = max(self.stack[-1][2], tracemalloc.get_traced_memory()[1])
+
+    def count(self, name: str, value: int):
+        self.counts[name] = value
+
+    def add(self, name: str, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def count_instance(self, core: str):
+        self.instances[core] = self.instances.get(core, 0) + 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            'model': self.model_file,
+            'version': utils.__version__,
+            'date': self.created.isoformat(timespec='seconds'),
+            'cached': self.cached,
+            'total': round(self.elapsed(), 6),
+            'phases': {name: round(value, 6) for name, value in self.phases.items()},
+            'counts': dict(self.counts),
+            'instances': dict(sorted(self.instances.items())),
+            'memory': dict(self.memory)
+        }
+
+    def save(self, filename: str):
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=4)
+            file.write('\n')
@@ -0,0 +1,111 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from errors import TemplateError
+import utils
+
+CHUNK_SIZE = 1024 * 1024
+INSTANCE = re.compile(r'^\s+(\w+)\s+(?:#\s*\(|\w+\s*\()', re.M)
+
+
+def get_digest(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_instances(top_file: str) -> set:
+    with open(top_file) as file:
+        return set(INSTANCE.findall(file.read()))
+
+
+class Bundle:
+    cores_dir = 'cores'
+    filelist_suffix = '.f'
+
+    def __init__(self, directory: str):
+        self.logger = utils.get_logger(__name__)
+        self.directory = directory
+        self.copied = 0
+        self.skipped = 0
+
+    def get_top_file(self, output_file: str) -> str:
+        return os.path.join(self.directory, os.path.basename(output_file))
+
+    def is_current(self, source: str, target: str) -> bool:
+        try:
+            target_stat = os.stat(target)
+        except OSError:
+            return False
+        source_stat = os.stat(source)
+        if source_stat.st_size != target_stat.st_size:
+            return False
+        if source_stat.st_mtime == target_stat.st_mtime:
+            return True
+        if get_digest(source) != get_digest(target):
+            return False
+        os.utime(target, (target_stat.st_atime, source_stat.st_mtime))
+        return True
+
+    def add_source(self, source: str) -> str:
+        name = os.path.join(self.cores_dir, os.path.basename(source))
+        target = os.path.join(self.directory, name)
+        try:
+            if self.is_current(source, target):
+                self.skipped += 1
+                return name
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+            os.close(handle)
+            try:
+                shutil.copy2(source, temp_path)
+                os.replace(temp_path, target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        except OSError as e:
+            raise TemplateError("Не удалось скопировать исходный файл ядра {0}: {1}".format(source, e))
+        self.logger.info("Копирую ядро {0}".format(source))
+        self.copied += 1
+        return name
+
+    def write(self, top_file: str, sources: list) -> str:
+        self.logger.info(utils.separator)
+        self.logger.info("Собираю комплект исходных файлов в {0}...".format(self.directory))
+        os.makedirs(os.path.join(self.directory, self.cores_dir), exist_ok=True)
+        files = []
+        for source in sources:
+            name = self.add_source(source)
+            if name not in files:
+                files.append(name)
+        files.append(os.path.relpath(top_file, self.directory))
+        filelist = os.path.splitext(top_file)[0] + self.filelist_suffix
+        with open(filelist, 'w') as file:
+            file.write('\n'.join(files) + '\n')
+        self.logger.info("Скопировано ядер: {0}, без изменений: {1}".format(self.copied, self.skipped))
+        return filelist
@@ -0,0 +1,64 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import re
+
+TOKEN = re.compile(r'\{\{|\}\}|\{(\w+)\}')
+
+
+class CompiledTemplate:
+    def __init__(self, text: str):
+        self.segments = []
+        literal = []
+        position = 0
+        for match in TOKEN.finditer(text):
+            literal.append(text[position:match.start()])
+            position = match.end()
+            if match.group(1) is None:
+                literal.append(match.group(0)[0])
+                continue
+            self.segments.append((False, ''.join(literal)))
+            self.segments.append((True, match.group(1)))
+            literal = []
+        literal.append(text[position:])
+        self.segments.append((False, ''.join(literal)))
+        self.segments = [x for x in self.segments if x[0] or x[1]]
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @property
+    def names(self) -> set:
+        return {value for is_placeholder, value in self.segments if is_placeholder}
+
+    def render(self, sections: dict) -> str:
+        return ''.join(self.iter_render(sections))
+
+    def iter_render(self, sections: dict):
+        for is_placeholder, value in self.segments:
+            if not is_placeholder:
+                yield value
+            elif isinstance(sections.get(value), list):
+                yield from sections[value]
+            elif value in sections:
+                yield str(sections[value])
+            else:
+                yield '{' + value + '}'
@@ -0,0 +1,299 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import ast
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+from build_cache import CACHE_DIR
+import utils
+
+INDEX_VERSION = 2
+COMMENTS = re.compile(r'//[^\n]*|/\*.*?\*/|\(\*.*?\*\)', re.S)
+SUBROUTINES = re.compile(r'\b(function|task)\b.*?\bend\1\b', re.S)
+TOKEN = re.compile(r"\[[^\]]*\]|\d*'[sS]?[bBoOdDhH][0-9a-fA-F_]+|\w+|\S")
+LITERAL = re.compile(r"\d*'[sS]?([bBoOdDhH])([0-9a-fA-F_]+)")
+BASES = {'b': 2, 'o': 8, 'd': 10, 'h': 16}
+DIRECTIONS = ['input', 'output', 'inout']
+QUALIFIERS = ['wire', 'reg', 'logic', 'signed', 'unsigned', 'integer', 'real', 'tri']
+DECLARATIONS = DIRECTIONS + ['parameter', 'localparam']
+OPERATORS = {
+    ast.Add: lambda x, y: x + y,
+    ast.Sub: lambda x, y: x - y,
+    ast.Mult: lambda x, y: x * y,
+    ast.FloorDiv: lambda x, y: x // y,
+    ast.Div: lambda x, y: x // y,
+    ast.Mod: lambda x, y: x % y,
+    ast.Pow: lambda x, y: x ** y
+}
+
+libraries = {}
+
+
+class CoreModule:
+    def __init__(self, name: str, path: str, params=None, ports=None):
+        self.name = name
+        self.path = path
+        self.params = params or {}
+        self.ports = ports or {}
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'params': self.params,
+            'ports': self.ports
+        }
+
+    @classmethod
+    def from_dict(cls, path: str, data: dict):
+        return cls(data['name'], path, data['params'], data['ports'])
+
+    def get_width(self, port: str, params: dict):
+        width = self.ports[port]['width']
+        if width is None:
+            return 1
+        values = {key: value for key, value in self.params.items() if value is not None}
+        values.update({key: str(value) for key, value in params.items()})
+        try:
+            msb, lsb = width.split(':')
+            return abs(evaluate(msb, values) - evaluate(lsb, values)) + 1
+        except (ValueError, KeyError, TypeError, SyntaxError, ZeroDivisionError, RecursionError):
+            return None
+
+    def validate(self, params: dict, ports: dict) -> list:
+        errors = []
+        for name in params:
+            if name not in self.params:
+                errors.append("нет параметра {0}".format(name))
+        for name in ports:
+            if name not in self.ports:
+                errors.append("нет порта {0}".format(name))
+        for name, port in self.ports.items():
+            if port['direction'] == 'input' and name not in ports:
+                errors.append("не подключен вход {0}".format(name))
+        return errors
+
+
+def evaluate(expression: str, values: dict, depth=0) -> int:
+    expression = LITERAL.sub(lambda x: str(int(x.group(2).replace('_', ''), BASES[x.group(1).lower()])), expression)
+    return evaluate_node(ast.parse(expression, mode='eval').body, values, depth)
+
+
+def evaluate_node(node, values: dict, depth: int) -> int:
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+    if isinstance(node, ast.Name):
+        if depth > 8:
+            raise RecursionError(node.id)
+        return evaluate(values[node.id], values, depth + 1)
+    if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+        left = evaluate_node(node.left, values, depth)
+        right = evaluate_node(node.right, values, depth)
+        return OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -evaluate_node(node.operand, values, depth)
+    raise ValueError(ast.dump(node))
+
+
+def read_value(tokens: list, position: int) -> tuple:
+    value = []
+    depth = 0
+    while position < len(tokens):
+        token = tokens[position]
+        if token in '({':
+            depth += 1
+        elif token in ')}':
+            if depth == 0:
+                break
+            depth -= 1
+        elif token in ',;' and depth == 0:
+            break
+        value.append(token)
+        position += 1
+    return ' '.join(value), position
+
+
+def read_declarations(tokens: list):
+    position = 0
+    while position < len(tokens):
+        keyword = tokens[position]
+        position += 1
+        if keyword not in DECLARATIONS:
+            continue
+        width = None
+        while position < len(tokens) and (tokens[position] in QUALIFIERS or tokens[position].startswith('[')):
+            if tokens[position].startswith('['):
+                width = tokens[position][1:-1].strip()
+            position += 1
+        while position < len(tokens) and re.match(r'\w+$', tokens[position]):
+            item = tokens[position]
+            position += 1
+            value = None
+            if position < len(tokens) and tokens[position] == '=':
+                value, position = read_value(tokens, position + 1)
+            yield keyword, item, value, width
+            if position >= len(tokens) or tokens[position] != ',':
+                break
+            if position + 1 < len(tokens) and tokens[position + 1] in DECLARATIONS:
+                break
+            position += 1
+
+
+def find_header_end(tokens: list) -> int:
+    depth = 0
+    for position, token in enumerate(tokens):
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif token == ';' and depth == 0:
+            return position
+    return len(tokens)
+
+
+def get_port_names(header: list) -> set:
+    names = set()
+    depth = 0
+    port_list = False
+    for position, token in enumerate(header):
+        if token == '(':
+            if depth == 0:
+                port_list = position == 0 or header[position - 1] != '#'
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth == 1 and port_list and re.match(r'\w+$', token):
+            names.add(token)
+    return names
+
+
+def parse_module(text: str, name: str):
+    text = SUBROUTINES.sub(' ', COMMENTS.sub(' ', text))
+    match = re.search(r'\bmodule\s+{0}\b(.*?)\bendmodule\b'.format(re.escape(name)), text, re.S)
+    if not match:
+        return None
+    tokens = TOKEN.findall(match.group(1))
+    header_end = find_header_end(tokens)
+    header = tokens[:header_end]
+    port_names = get_port_names(header)
+    params = {}
+    ports = {}
+    for in_header, part in [(True, header), (False, tokens[header_end + 1:])]:
+        for keyword, item, value, width in read_declarations(part):
+            if keyword == 'parameter':
+                params[item] = value
+            elif keyword in DIRECTIONS and (in_header or item in port_names):
+                ports[item] = {'direction': keyword, 'width': width}
+    return params, ports
+
+
+class CoreLibrary:
+    def __init__(self, directory: str, index_file=None):
+        self.logger = utils.get_logger(__name__)
+        self.directory = directory
+        self.available = os.path.isdir(directory)
+        self.index_file = index_file or os.path.join(
+            CACHE_DIR,
+            'cores-{0}.json'.format(hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()[:16])
+        )
+        self.entries = {}
+        self.modules = {}
+        self.changed = False
+        self.lock = threading.Lock()
+        if self.available:
+            self.load()
+        else:
+            self.logger.warning("Каталог библиотеки ядер не найден: {0}, проверка подключений отключена".format(directory))
+
+    @classmethod
+    def open(cls, directory: str):
+        key = os.path.abspath(directory)
+        if key not in libraries:
+            libraries[key] = cls(directory)
+        return libraries[key]
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return CoreLibrary.open, (self.directory,)
+
+    def get_path(self, name: str) -> str:
+        return '{0}/{1}/hdl/{1}.v'.format(self.directory, name)
+
+    def load(self):
+        try:
+            with open(self.index_file) as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return
+        if index.get('version') == INDEX_VERSION:
+            self.entries = index.get('modules', {})
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            index = {
+                'version': INDEX_VERSION,
+                'directory': os.path.abspath(self.directory),
+                'modules': self.entries
+            }
+            self.changed = False
+        try:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_file), suffix='.tmp')
+            with os.fdopen(handle, 'w') as file:
+                json.dump(index, file)
+            os.replace(temp_path, self.index_file)
+        except OSError as e:
+            self.logger.warning("Не удалось сохранить индекс библиотеки ядер: {0}".format(e))
+
+    def get(self, name: str):
+        path = self.get_path(name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            module = self.modules.get(name)
+            entry = self.entries.get(path)
+            if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                if module is None and entry['module'] is not None:
+                    module = self.modules[name] = CoreModule.from_dict(path, entry['module'])
+                return module
+        self.logger.info("Индексирую ядро {0}".format(path))
+        with open(path, errors='replace') as file:
+            parsed = parse_module(file.read(), name)
+        module = CoreModule(name, path, *parsed) if parsed else None
+        with self.lock:
+            self.modules[name] = module
+            self.entries[path] = {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'module': module.to_dict() if module else None
+            }
+            self.changed = True
+        return module
@@ -0,0 +1,255 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import argparse
+import collections
+import http.server
+import io
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+from build_cache import BuildCache
+from build_report import BuildReport
+from errors import GeneratorError, ModelError
+from extractor import ExtractorError, ExtractorWorker
+from parser import Parser
+from template_builder import CORES_DIR, TemplateBuilder
+import utils
+
+HOST = '127.0.0.1'
+PORT = 8765
+CACHE_SIZE = 64
+
+logger = utils.get_logger('daemon')
+
+
+class CompileServer:
+    def __init__(
+        self,
+        template='default.template',
+        adder_optimization=False,
+        extractor=None,
+        cache_size=CACHE_SIZE,
+        cores_dir=CORES_DIR
+    ):
+        self.template = template
+        self.cores_dir = cores_dir
+        self.adder_optimization = adder_optimization
+        self.extractor = extractor
+        self.cache_size = cache_size
+        self.results = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        TemplateBuilder(template, cores_dir)
+
+    def compile(self, model_file: str, template=None, adder_optimization=None) -> tuple:
+        template = template or self.template
+        if adder_optimization is None:
+            adder_optimization = self.adder_optimization
+        report = BuildReport(model_file)
+        builder = TemplateBuilder(template, self.cores_dir)
+        try:
+            key = BuildCache.key(model_file, builder.sources, adder_optimization)
+        except OSError as e:
+            raise ModelError("Не удалось прочитать файл модели: {0}".format(e))
+        with self.lock:
+            self.requests += 1
+            result = self.results.get(key)
+            if result is not None:
+                self.results.move_to_end(key)
+        if result is not None:
+            report.cached = True
+            return result, report
+        try:
+            parser = Parser(model_file, adder_optimization, self.extractor, report)
+        except OSError as e:
+            raise ModelError("Не удалось прочитать файл модели: {0}".format(e))
+        builder.build(parser)
+        sink = io.StringIO()
+        builder.write(sink)
+        result = sink.getvalue()
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+        return result, report
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                'version': utils.__version__,
+                'uptime': round(time.time() - self.started, 3),
+                'requests': self.requests,
+                'errors': self.errors,
+                'cached_results': len(self.results),
+                'extractor': self.extractor is not None
+            }
+
+    def close(self):
+        if self.extractor:
+            self.extractor.close()
+
+
+class CompileHandler(http.server.BaseHTTPRequestHandler):
+    server_version = 'xcos-gen/' + utils.__version__
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self) -> str:
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s %s", self.address_string(), fmt % args)
+
+    def send_body(self, code: int, body: bytes, content_type: str, headers=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, code: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_body(code, body, 'application/json; charset=utf-8')
+
+    def send_error_json(self, code: int, error: dict):
+        with self.server.compiler.lock:
+            self.server.compiler.errors += 1
+        self.send_json(code, {'error': error})
+
+    def do_GET(self):
+        if self.path == '/status':
+            self.send_json(200, self.server.compiler.status())
+        else:
+            self.send_error_json(404, {'type': 'NotFound', 'message': "Неизвестный адрес: {0}".format(self.path)})
+
+    def do_POST(self):
+        if self.path != '/compile':
+            self.send_error_json(404, {'type': 'NotFound', 'message': "Неизвестный адрес: {0}".format(self.path)})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            model_file = request['model']
+            template = request.get('template')
+            adder_optimization = request.get('adder_optimization')
+            if not isinstance(model_file, str):
+                raise TypeError("поле model должно быть строкой")
+            if template is not None and not isinstance(template, str):
+                raise TypeError("поле template должно быть строкой")
+            if adder_optimization is not None and not isinstance(adder_optimization, bool):
+                raise TypeError("поле adder_optimization должно быть логическим")
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error_json(400, {'type': 'BadRequest', 'message': "Некорректный запрос: {0}".format(e)})
+            return
+        try:
+            result, report = self.server.compiler.compile(model_file, template, adder_optimization)
+        except GeneratorError as e:
+            logger.warning("Ошибка сборки %s: %s", model_file, e)
+            self.send_error_json(422, e.to_dict())
+            return
+        except Exception as e:
+            logger.exception("Внутренняя ошибка при сборке %s", model_file)
+            self.send_error_json(500, {'type': type(e).__name__, 'message': str(e)})
+            return
+        self.send_body(200, result.encode('utf-8'), 'text/plain; charset=utf-8', {
+            'X-Build-Time': '{0:.6f}'.format(report.elapsed()),
+            'X-Build-Cached': str(report.cached).lower()
+        })
+
+
+class HttpServer(http.server.ThreadingHTTPServer):
+    def __init__(self, address, compiler: CompileServer):
+        super().__init__(address, CompileHandler)
+        self.compiler = compiler
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, compiler: CompileServer):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, CompileHandler)
+        self.compiler = compiler
+
+
+def main(args=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Сервер сборки HDL из моделей Xcos")
+    arg_parser.add_argument('--host', default=HOST, help="адрес для HTTP")
+    arg_parser.add_argument('-p', '--port', type=int, default=PORT, help="порт для HTTP")
+    arg_parser.add_argument('--socket', default=None, help="путь к Unix-сокету вместо HTTP-порта")
+    arg_parser.add_argument('-t', '--template', default='default.template', help="шаблон по умолчанию")
+    arg_parser.add_argument('--cores-dir', default=CORES_DIR, help="каталог библиотеки ядер HDL")
+    arg_parser.add_argument('--adder-optimization', action='store_true', help="объединять каскады сумматоров")
+    arg_parser.add_argument('--jvm', action='store_true', help="извлекать коэффициенты через ExtractorWorker")
+    arg_parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="число результатов в памяти")
+    arg_parser.add_argument('--log-level', choices=sorted(utils.log_levels), default='warning', help="уровень журнала")
+    options = arg_parser.parse_args(args)
+    utils.set_log_level(options.log_level)
+    logger.setLevel(min(utils.log_level, logging.INFO))
+
+    extractor = None
+    try:
+        if options.jvm:
+            extractor = ExtractorWorker()
+            extractor.start()
+        compiler = CompileServer(
+            options.template,
+            options.adder_optimization,
+            extractor,
+            options.cache_size,
+            options.cores_dir
+        )
+    except (ExtractorError, GeneratorError) as e:
+        logger.error(e)
+        return 1
+    if options.socket:
+        server = UnixServer(options.socket, compiler)
+        address = options.socket
+    else:
+        server = HttpServer((options.host, options.port), compiler)
+        address = 'http://{0}:{1}'.format(options.host, options.port)
+    logger.info("xcos-gen {0}: сервер сборки запущен на {1}".format(utils.__version__, address))
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        compiler.close()
+        if options.socket and os.path.exists(options.socket):
+            os.remove(options.socket)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import struct
+
+STREAM_MAGIC = 0xaced
+STREAM_VERSION = 5
+BASE_WIRE_HANDLE = 0x7e0000
+
+TC_NULL = 0x70
+TC_REFERENCE = 0x71
+TC_CLASSDESC = 0x72
+TC_OBJECT = 0x73
+TC_STRING = 0x74
+TC_ARRAY = 0x75
+TC_CLASS = 0x76
+TC_BLOCKDATA = 0x77
+TC_ENDBLOCKDATA = 0x78
+TC_RESET = 0x79
+TC_BLOCKDATALONG = 0x7a
+TC_EXCEPTION = 0x7b
+TC_LONGSTRING = 0x7c
+TC_PROXYCLASSDESC = 0x7d
+TC_ENUM = 0x7e
+
+SC_WRITE_METHOD = 0x01
+SC_SERIALIZABLE = 0x02
+SC_EXTERNALIZABLE = 0x04
+SC_BLOCK_DATA = 0x08
+
+PRIMITIVES = {
+    'B': ('>b', 1),
+    'C': ('>H', 2),
+    'D': ('>d', 8),
+    'F': ('>f', 4),
+    'I': ('>i', 4),
+    'J': ('>q', 8),
+    'S': ('>h', 2),
+    'Z': ('>?', 1)
+}
+
+SCILAB_TYPES = 'org.scilab.modules.types.'
+SCILAB_LISTS = ['ScilabList', 'ScilabTList', 'ScilabMList']
+
+
+class DictionaryError(Exception):
+    pass
+
+
+class JavaClass:
+    def __init__(self, name: str, uid: int, flags: int, fields: list):
+        self.name = name
+        self.uid = uid
+        self.flags = flags
+        self.fields = fields
+        self.annotations = []
+        self.super_class = None
+
+    def hierarchy(self) -> list:
+        classes = []
+        current = self
+        while current:
+            classes.insert(0, current)
+            current = current.super_class
+        return classes
+
+
+class JavaObject:
+    def __init__(self, java_class: JavaClass):
+        self.java_class = java_class
+        self.fields = {}
+        self.contents = []
+
+    @property
+    def class_name(self) -> str:
+        return self.java_class.name
+
+    def objects(self) -> list:
+        return [x for x in self.contents if not isinstance(x, bytes)]
+
+    def block_data(self) -> bytes:
+        return b''.join(x for x in self.contents if isinstance(x, bytes))
+
+
+class ScilabValue:
+    def __init__(self, type_name: str, data, imaginary=None):
+        self.type_name = type_name
+        self.data = data
+        self.imaginary = imaginary
+
+    def is_scalar(self) -> bool:
+        return isinstance(self.data, list) and len(self.data) == 1 and len(self.data[0]) == 1
+
+    def scalar(self):
+        if not self.is_scalar():
+            raise DictionaryError("Значение {0} не является скаляром".format(self.type_name))
+        return self.data[0][0]
+
+    def __str__(self):
+        if self.is_scalar():
+            return '[{0}]'.format(self.scalar())
+        return '{0}: {1}'.format(self.type_name, self.data)
+
+
+class JavaStreamReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+        self.handles = []
+
+    def read(self, size: int) -> bytes:
+        if self.offset + size > len(self.data):
+            raise DictionaryError("Неожиданный конец потока на позиции {0}".format(self.offset))
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def unpack(self, fmt: str, size: int):
+        return struct.unpack(fmt, self.read(size))[0]
+
+    def read_byte(self) -> int:
+        return self.unpack('>B', 1)
+
+    def peek_byte(self) -> int:
+        if self.offset >= len(self.data):
+            raise DictionaryError("Неожиданный конец потока на позиции {0}".format(self.offset))
+        return self.data[self.offset]
+
+    def read_utf(self, long=False) -> str:
+        size = self.unpack('>q', 8) if long else self.unpack('>H', 2)
+        raw = self.read(size).replace(b'\xc0\x80', b'\x00')
+        text = raw.decode('utf-8', errors='surrogatepass')
+        return text.encode('utf-16', errors='surrogatepass').decode('utf-16')
+
+    def new_handle(self, value):
+        self.handles.append(value)
+        return len(self.handles) - 1
+
+    def read_stream(self) -> list:
+        if self.unpack('>H', 2) != STREAM_MAGIC or self.unpack('>H', 2) != STREAM_VERSION:
+            raise DictionaryError("Поток не является сериализованным объектом Java")
+        contents = []
+        while self.offset < len(self.data):
+            contents.append(self.read_content())
+        return contents
+
+    def read_content(self):
+        tc = self.peek_byte()
+        if tc == TC_BLOCKDATA:
+            self.offset += 1
+            return self.read(self.read_byte())
+        if tc == TC_BLOCKDATALONG:
+            self.offset += 1
+            return self.read(self.unpack('>i', 4))
+        return self.read_object()
+
+    def read_contents(self) -> list:
+        contents = []
+        while self.peek_byte() != TC_ENDBLOCKDATA:
+            contents.append(self.read_content())
+        self.offset += 1
+        return contents
+
+    def read_object(self):
+        tc = self.read_byte()
+        if tc == TC_NULL:
+            return None
+        if tc == TC_REFERENCE:
+            return self.handles[self.unpack('>i', 4) - BASE_WIRE_HANDLE]
+        if tc == TC_STRING:
+            value = self.read_utf()
+            self.new_handle(value)
+            return value
+        if tc == TC_LONGSTRING:
+            value = self.read_utf(long=True)
+            self.new_handle(value)
+            return value
+        if tc == TC_CLASSDESC or tc == TC_PROXYCLASSDESC:
+            self.offset -= 1
+            return self.read_class_desc()
+        if tc == TC_CLASS:
+            java_class = self.read_class_desc()
+            self.new_handle(java_class)
+            return java_class
+        if tc == TC_ARRAY:
+            return self.read_array()
+        if tc == TC_ENUM:
+            self.read_class_desc()
+            handle = self.new_handle(None)
+            name = self.read_object()
+            self.handles[handle] = name
+            return name
+        if tc == TC_OBJECT:
+            return self.read_new_object()
+        if tc == TC_RESET:
+            self.handles = []
+            return self.read_object()
+        raise DictionaryError("Неподдерживаемый элемент потока 0x{0:02x} на позиции {1}".format(tc, self.offset - 1))
+
+    def read_class_desc(self):
+        tc = self.read_byte()
+        if tc == TC_NULL:
+            return None
+        if tc == TC_REFERENCE:
+            return self.handles[self.unpack('>i', 4) - BASE_WIRE_HANDLE]
+        if tc == TC_PROXYCLASSDESC:
+            java_class = JavaClass('$Proxy', 0, SC_SERIALIZABLE, [])
+            self.new_handle(java_class)
+            for _ in range(self.unpack('>i', 4)):
+                self.read_utf()
+        elif tc == TC_CLASSDESC:
+            name = self.read_utf()
+            uid = self.unpack('>q', 8)
+            java_class = JavaClass(name, uid, 0, [])
+            self.new_handle(java_class)
+            java_class.flags = self.read_byte()
+            for _ in range(self.unpack('>H', 2)):
+                type_code = chr(self.read_byte())
+                field_name = self.read_utf()
+                if type_code in '[L':
+                    self.read_object()
+                java_class.fields.append((type_code, field_name))
+        else:
+            raise DictionaryError("Ожидалось описание класса на позиции {0}".format(self.offset - 1))
+        java_class.annotations = self.read_contents()
+        java_class.super_class = self.read_class_desc()
+        return java_class
+
+    def read_value(self, type_code: str):
+        if type_code in PRIMITIVES:
+            fmt, size = PRIMITIVES[type_code]
+            value = self.unpack(fmt, size)
+            return chr(value) if type_code == 'C' else value
+        return self.read_object()
+
+    def read_array(self) -> list:
+        java_class = self.read_class_desc()
+        array = []
+        self.new_handle(array)
+        size = self.unpack('>i', 4)
+        element_type = java_class.name[1]
+        if element_type in PRIMITIVES:
+            fmt, width = PRIMITIVES[element_type]
+            array.extend(struct.unpack('>{0}{1}'.format(size, fmt[1]), self.read(size * width)))
+            if element_type == 'C':
+                array[:] = [chr(x) for x in array]
+        else:
+            for _ in range(size):
+                array.append(self.read_object())
+        return array
+
+    def read_new_object(self) -> JavaObject:
+        java_class = self.read_class_desc()
+        instance = JavaObject(java_class)
+        handle = self.new_handle(instance)
+        if java_class.flags & SC_EXTERNALIZABLE:
+            if not java_class.flags & SC_BLOCK_DATA:
+                raise DictionaryError("Неподдерживаемый протокол сериализации класса {0}".format(java_class.name))
+            instance.contents.extend(self.read_contents())
+        else:
+            for current in java_class.hierarchy():
+                if not current.flags & SC_SERIALIZABLE:
+                    continue
+                for type_code, field_name in current.fields:
+                    instance.fields[field_name] = self.read_value(type_code)
+                if current.flags & SC_WRITE_METHOD:
+                    instance.contents.extend(self.read_contents())
+        value = convert(instance)
+        self.handles[handle] = value
+        return value
+
+
+def convert(instance: JavaObject):
+    if not instance.class_name.startswith(SCILAB_TYPES):
+        return instance
+    type_name = instance.class_name[len(SCILAB_TYPES):]
+    objects = instance.objects()
+    if type_name in SCILAB_LISTS:
+        if len(objects) == 1 and isinstance(objects[0], list):
+            objects = objects[0]
+        while objects and (objects[-1] is None or isinstance(objects[-1], str)):
+            objects.pop()
+        return objects
+    if 'realPart' in instance.fields:
+        return ScilabValue(type_name, instance.fields['realPart'], instance.fields.get('imaginaryPart'))
+    arrays = [x for x in objects if isinstance(x, list)]
+    arrays.extend(x for x in instance.fields.values() if isinstance(x, list))
+    if not arrays:
+        return ScilabValue(type_name, [])
+    imaginary = arrays[1] if type_name == 'ScilabDouble' and len(arrays) > 1 else None
+    return ScilabValue(type_name, arrays[0], imaginary)
+
+
+def read_dictionary(data: bytes) -> list:
+    contents = JavaStreamReader(data).read_stream()
+    objects = [x for x in contents if not isinstance(x, bytes)]
+    if len(objects) != 1 or not isinstance(objects[0], list):
+        raise DictionaryError("Поток не содержит список значений Scilab")
+    return objects[0]
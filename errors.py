@@ -20,11 +20,17 @@
 """
 
 
-class SafeDict(dict):
-    def __init__(self, d: dict, **kwargs):
-        super().__init__(**kwargs)
-        for key in d.keys():
-            self[key] = d[key]
-
-    def __missing__(self, key):
-        return '{' + key + '}'
+class GeneratorError(Exception):
+    def to_dict(self) -> dict:
+        return {
+            'type': type(self).__name__,
+            'message': str(self)
+        }
+
+
+class ModelError(GeneratorError):
+    pass
+
+
+class TemplateError(GeneratorError):
+    pass
@@ -0,0 +1,115 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import os
+import subprocess
+import threading
+
+import utils
+
+SCILAB_ROOT = '/home/ilia/scilab-5.5.2/'
+JAVA = '/usr/lib/jvm/jdk1.8.0_72/bin/java'
+JGRAPHX = '/home/ilia/Downloads/'
+WORKER_CLASS = 'ExtractorWorker'
+
+
+class ExtractorError(Exception):
+    pass
+
+
+class ExtractorWorker:
+    def __init__(self, java=JAVA, scilab_root=SCILAB_ROOT, jgraphx=JGRAPHX):
+        self.logger = utils.get_logger(__name__)
+        self.classpath = ':'.join([
+            os.path.dirname(os.path.abspath(__file__)),
+            scilab_root + 'share/scilab/modules/types/jar/org.scilab.modules.types.jar',
+            jgraphx + 'jgraphx.jar'
+        ])
+        self.java = java
+        self.process = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        if self.process and self.process.poll() is None:
+            return
+        class_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), WORKER_CLASS + '.class')
+        if not os.path.exists(class_file):
+            raise ExtractorError("Не найден {0}, скомпилируйте {1}.java при помощи javac".format(
+                class_file,
+                WORKER_CLASS
+            ))
+        self.logger.info("Запускаю процесс извлечения параметров: {0}".format(self.java))
+        try:
+            self.process = subprocess.Popen(
+                [self.java, '-classpath', self.classpath, WORKER_CLASS],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                encoding='utf-8'
+            )
+        except OSError as e:
+            raise ExtractorError("Не удалось запустить JVM: {0}".format(e))
+
+    def extract(self, data_file: str, positions: list) -> dict:
+        positions = sorted(set(positions))
+        if not positions:
+            return {}
+        with self.lock:
+            self.start()
+            request = '\t'.join([os.path.abspath(data_file)] + [str(x) for x in positions])
+            try:
+                self.process.stdin.write(request + '\n')
+                self.process.stdin.flush()
+                lines = []
+                while True:
+                    line = self.process.stdout.readline()
+                    if not line:
+                        raise ExtractorError("Процесс извлечения параметров неожиданно завершился")
+                    line = line.strip()
+                    if line == '.':
+                        break
+                    lines.append(line)
+            except (OSError, ValueError) as e:
+                self.close()
+                raise ExtractorError("Ошибка обмена с процессом извлечения параметров: {0}".format(e))
+        if lines and lines[0].startswith('ERROR'):
+            raise ExtractorError(lines[0][len('ERROR '):])
+        if len(lines) != len(positions):
+            raise ExtractorError("Получено {0} значений вместо {1}".format(len(lines), len(positions)))
+        return dict(zip(positions, lines))
+
+    def close(self):
+        if not self.process:
+            return
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
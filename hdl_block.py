@@ -29,8 +29,13 @@ class HdlBlock:
         self.gain = block.gain
         self.inputs = block.inputs
         self.outputs = block.outputs
+        self.port = block.port
+        self.subsystem = block.subsystem
+        self.input_ports = block.input_ports
+        self.output_ports = block.output_ports
         self.in_wire = None
         self.out_wire = None
+        self.instance_name = None
 
     def __str__(self):
         if not self.gain:
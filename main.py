@@ -19,19 +19,86 @@
 
 """
 
+import argparse
+import cProfile
+import os
+import sys
+
+from build_cache import BuildCache, CACHE_DIR
+from build_report import BuildReport
+from bundle import Bundle, get_instances
+from errors import GeneratorError, ModelError
 from parser import Parser
-from template_builder import TemplateBuilder
+from template_builder import CORES_DIR, TemplateBuilder
 import utils
 
+arg_parser = argparse.ArgumentParser(description="Сборка HDL из модели Xcos")
+arg_parser.add_argument('-m', '--model', default='./model.zcos', help="файл модели .zcos")
+arg_parser.add_argument('-t', '--template', default='default.template', help="файл шаблона")
+arg_parser.add_argument('--cores-dir', default=CORES_DIR, help="каталог библиотеки ядер HDL")
+arg_parser.add_argument('-o', '--output', default='output.v', help="файл результата")
+arg_parser.add_argument('--no-gain-folding', action='store_true', help="не сворачивать цепочки коэффициентов усиления")
+arg_parser.add_argument('--bundle', help="каталог для файла результата вместе с исходными файлами ядер")
+arg_parser.add_argument('--no-cache', action='store_true', help="не использовать кэш сборки")
+arg_parser.add_argument('--clear-cache', action='store_true', help="очистить кэш сборки")
+arg_parser.add_argument('--cache-dir', default=CACHE_DIR, help="каталог кэша сборки")
+arg_parser.add_argument('-q', '--quiet', action='store_true', help="выводить только предупреждения и ошибки")
+arg_parser.add_argument('--report', help="сохранить отчёт о сборке в формате JSON")
+arg_parser.add_argument('--profile', help="сохранить профиль cProfile")
+arg_parser.add_argument('--log-level', choices=sorted(utils.log_levels), default='debug', help="уровень журнала")
+options = arg_parser.parse_args()
+utils.set_log_level('warning' if options.quiet else options.log_level)
+
 logger = utils.get_logger('main')
 logger.info("xcos-gen, версия {0}, разработчик {1}".format(
     utils.__version__,
     utils.__author__
 ))
 
-parser = Parser('./model.zcos', False)
-builder = TemplateBuilder('default.template')
-builder.build(parser)
+cache = BuildCache(options.cache_dir)
+if options.clear_cache:
+    cache.clear()
+
+profiler = None
+if options.profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+report = BuildReport(options.model)
+output_file = options.output
+bundle = None
+if options.bundle:
+    bundle = Bundle(options.bundle)
+    output_file = bundle.get_top_file(options.output)
+    os.makedirs(options.bundle, exist_ok=True)
+try:
+    builder = TemplateBuilder(options.template, options.cores_dir)
+    key = None
+    if not options.no_cache:
+        try:
+            key = cache.key(options.model, builder.sources, False, not options.no_gain_folding)
+        except OSError as e:
+            raise ModelError("Не удалось прочитать файл модели: {0}".format(e))
+    if key and cache.fetch(key, output_file):
+        report.cached = True
+    else:
+        parser = Parser(options.model, False, report=report, enable_gain_folding=not options.no_gain_folding)
+        builder.build(parser)
+        with open(output_file, 'w') as file:
+            builder.write(file)
+        if key:
+            cache.store(key, output_file)
+    if bundle:
+        instances = get_instances(output_file) if report.cached else None
+        bundle.write(output_file, builder.get_core_sources(instances))
+except GeneratorError as e:
+    logger.error(e)
+    sys.exit(1)
 
-with open('output.v', 'w') as file:
-    file.write(builder.template)
+if profiler:
+    profiler.disable()
+    profiler.dump_stats(options.profile)
+    logger.info("Профиль сохранён в {0}".format(options.profile))
+if options.report:
+    report.save(options.report)
+    logger.info("Отчёт о сборке сохранён в {0}".format(options.report))
@@ -0,0 +1,401 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import argparse
+import random
+import struct
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+
+from dictionary_reader import (
+    BASE_WIRE_HANDLE, SC_BLOCK_DATA, SC_EXTERNALIZABLE, SC_SERIALIZABLE, SC_WRITE_METHOD, SCILAB_TYPES, STREAM_MAGIC,
+    STREAM_VERSION, TC_ARRAY, TC_BLOCKDATA, TC_CLASSDESC, TC_ENDBLOCKDATA, TC_NULL, TC_OBJECT, TC_REFERENCE,
+    DictionaryError, read_dictionary
+)
+from parser import Parser
+import utils
+
+TOPOLOGIES = ['chain', 'fanout', 'cascade', 'hierarchy']
+DEFAULT_MIX = {
+    'INTEGRAL_f': 2,
+    'DIFF_f': 2,
+    'GAIN_f': 3,
+    'SUM_f': 1
+}
+GAINS = [0.125, 0.25, 0.5, 1.0, 2.0, 3.0]
+ARRAY_LIST = ('java.util.ArrayList', SC_WRITE_METHOD | SC_SERIALIZABLE, [('I', 'size')])
+SERIAL_UIDS = {
+    'java.util.ArrayList': 8683452581122892189
+}
+
+
+class JavaStreamWriter:
+    def __init__(self):
+        self.data = bytearray(struct.pack('>HH', STREAM_MAGIC, STREAM_VERSION))
+        self.classes = {}
+        self.handle_count = 0
+
+    def new_handle(self) -> int:
+        self.handle_count += 1
+        return self.handle_count - 1
+
+    def write(self, fmt: str, *values):
+        self.data += struct.pack(fmt, *values)
+
+    def write_utf(self, text: str):
+        raw = text.encode('utf-8')
+        self.write('>H', len(raw))
+        self.data += raw
+
+    def write_block_data(self, raw: bytes):
+        self.write('>BB', TC_BLOCKDATA, len(raw))
+        self.data += raw
+
+    def write_class_desc(self, name: str, flags: int, fields=(), super_class=None):
+        if name in self.classes:
+            self.write('>Bi', TC_REFERENCE, BASE_WIRE_HANDLE + self.classes[name])
+            return
+        self.write('>B', TC_CLASSDESC)
+        self.write_utf(name)
+        self.write('>q', SERIAL_UIDS.get(name, 1))
+        self.classes[name] = self.new_handle()
+        self.write('>BH', flags, len(fields))
+        for type_code, field_name in fields:
+            self.write('>B', ord(type_code))
+            self.write_utf(field_name)
+        self.write('>B', TC_ENDBLOCKDATA)
+        if super_class:
+            self.write_class_desc(*super_class)
+        else:
+            self.write('>B', TC_NULL)
+
+    def write_double_array(self, values: list):
+        self.write('>B', TC_ARRAY)
+        self.write_class_desc('[D', SC_SERIALIZABLE)
+        self.new_handle()
+        self.write('>i', len(values))
+        self.write('>{0}d'.format(len(values)), *values)
+
+    def write_matrix(self, rows: list):
+        self.write('>B', TC_ARRAY)
+        self.write_class_desc('[[D', SC_SERIALIZABLE)
+        self.new_handle()
+        self.write('>i', len(rows))
+        for row in rows:
+            self.write_double_array(row)
+
+    def write_double(self, value: float):
+        self.write('>B', TC_OBJECT)
+        self.write_class_desc(SCILAB_TYPES + 'ScilabDouble', SC_EXTERNALIZABLE | SC_BLOCK_DATA)
+        self.new_handle()
+        self.write_block_data(struct.pack('>i', 0))
+        self.write_matrix([[value]])
+        self.write('>BB', TC_NULL, TC_NULL)
+        self.write_block_data(b'\x00')
+        self.write('>B', TC_ENDBLOCKDATA)
+
+    def write_list(self, values: list):
+        self.write('>B', TC_OBJECT)
+        self.write_class_desc(SCILAB_TYPES + 'ScilabList', SC_EXTERNALIZABLE | SC_BLOCK_DATA, super_class=ARRAY_LIST)
+        self.new_handle()
+        self.write_block_data(struct.pack('>ii', 0, len(values)))
+        for value in values:
+            self.write_double(value)
+        self.write('>BB', TC_NULL, TC_ENDBLOCKDATA)
+
+    def getvalue(self) -> bytes:
+        return bytes(self.data)
+
+
+def check_dictionary(data: bytes, values: list):
+    decoded = [x.scalar() for x in read_dictionary(data)]
+    if decoded != values:
+        raise DictionaryError("Записанный словарь не совпадает с прочитанным: {0} != {1}".format(values, decoded))
+
+
+class ModelGenerator:
+    block_tags = {
+        'SUM_f': 'RoundBlock',
+        'SPLIT': 'SplitBlock',
+        'IN_f': 'ExplicitInBlock',
+        'OUT_f': 'ExplicitOutBlock',
+        'SUPER_f': 'SuperBlock'
+    }
+    root_id = '0:1:0'
+    parent_id = '0:2:0'
+
+    def __init__(self, title='synthetic', seed=None, mix=None, prefix=''):
+        self.title = title
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.mix = mix or DEFAULT_MIX
+        self.prefix = prefix
+        self.blocks = []
+        self.links = []
+        self.subsystems = {}
+        self.block_id = 0
+
+    def __len__(self):
+        return len(self.blocks) + sum(len(x) for x in self.subsystems.values())
+
+    def add_block(self, block_type: str, gain=None) -> str:
+        self.block_id += 1
+        block_id = '{0}b{1}'.format(self.prefix, self.block_id)
+        if block_type == 'GAIN_f' and gain is None:
+            gain = self.random.choice(GAINS)
+        self.blocks.append((block_id, block_type, gain))
+        return block_id
+
+    def add_port(self, block_type: str, number: int) -> str:
+        return self.add_block(block_type, number)
+
+    def add_superblock(self, subsystem) -> str:
+        block_id = self.add_block('SUPER_f')
+        self.subsystems[block_id] = subsystem
+        return block_id
+
+    def add_link(self, source: str, target: str, source_port=None, target_port=None):
+        self.links.append((source, target, source_port, target_port))
+
+    def add_section(self, source: str) -> str:
+        block_type = self.random.choices(list(self.mix), list(self.mix.values()))[0]
+        if block_type != 'SUM_f':
+            block = self.add_block(block_type)
+            self.add_link(source, block)
+            return block
+        split = self.add_block('SPLIT')
+        gain = self.add_block('GAIN_f')
+        adder = self.add_block('SUM_f')
+        self.add_link(source, split)
+        self.add_link(split, gain)
+        self.add_link(split, adder)
+        self.add_link(gain, adder)
+        return adder
+
+    def add_fanout(self, source: str, width: int) -> list:
+        targets = []
+        for _ in range(width - 1):
+            split = self.add_block('SPLIT')
+            self.add_link(source, split)
+            target = self.add_block('GAIN_f')
+            self.add_link(split, target)
+            targets.append(target)
+            source = split
+        target = self.add_block('GAIN_f')
+        self.add_link(source, target)
+        targets.append(target)
+        return targets
+
+    def add_adder_tree(self, inputs: list) -> str:
+        while len(inputs) > 1:
+            merged = []
+            for index in range(0, len(inputs) - 1, 2):
+                adder = self.add_block('SUM_f')
+                self.add_link(inputs[index], adder)
+                self.add_link(inputs[index + 1], adder)
+                merged.append(adder)
+            if len(inputs) % 2:
+                merged.append(inputs[-1])
+            inputs = merged
+        return inputs[0]
+
+    def add_adder_chain(self, inputs: list) -> str:
+        current = inputs[0]
+        for item in inputs[1:]:
+            adder = self.add_block('SUM_f')
+            self.add_link(current, adder)
+            self.add_link(item, adder)
+            current = adder
+        return current
+
+    def chain(self, size: int):
+        current = self.add_block('INTEGRAL_f')
+        while len(self) < size:
+            current = self.add_section(current)
+
+    def fanout(self, size: int, width=None):
+        width = width or max(2, int(size ** 0.5) // 2)
+        source = self.add_block('INTEGRAL_f')
+        branches = self.add_fanout(source, width)
+        depth = max(0, (size - len(self)) // width - 1)
+        for index, branch in enumerate(branches):
+            for _ in range(depth):
+                branch = self.add_section(branch)
+            branches[index] = branch
+        self.add_adder_tree(branches)
+
+    def cascade(self, size: int):
+        width = max(2, (size - 1) // 3)
+        source = self.add_block('INTEGRAL_f')
+        self.add_adder_chain(self.add_fanout(source, width))
+
+    def create_subsystem(self, variant: str, index: int):
+        return ModelGenerator(
+            self.title,
+            '{0}:{1}'.format(self.seed, variant),
+            self.mix,
+            '{0}s{1}_'.format(self.prefix, index)
+        )
+
+    def subsystem(self, size: int, inputs=1, outputs=1, inner=None):
+        current = self.add_adder_tree([self.add_port('IN_f', x + 1) for x in range(inputs)])
+        if inner is not None:
+            block = self.add_superblock(inner)
+            self.add_link(current, block)
+            current = block
+        while len(self) < size:
+            current = self.add_section(current)
+        targets = self.add_fanout(current, outputs) if outputs > 1 else [current]
+        for number, target in enumerate(targets):
+            self.add_link(target, self.add_port('OUT_f', number + 1))
+
+    def hierarchy(self, size: int):
+        sub_size = max(4, int(size ** 0.5))
+        current = self.add_block('INTEGRAL_f')
+        index = 0
+        while len(self) < size:
+            index += 1
+            variant = index % 3
+            subsystem = self.create_subsystem(variant, index)
+            if variant == 0:
+                inner = subsystem.create_subsystem('inner', index)
+                inner.subsystem(sub_size // 2)
+                subsystem.subsystem(sub_size, inner=inner)
+            if variant == 1:
+                subsystem.subsystem(sub_size, 2, 2)
+                split = self.add_block('SPLIT')
+                gain = self.add_block('GAIN_f')
+                block = self.add_superblock(subsystem)
+                self.add_link(current, split)
+                self.add_link(split, gain)
+                self.add_link(split, block, None, 1)
+                self.add_link(gain, block, None, 2)
+                gain = self.add_block('GAIN_f')
+                current = self.add_block('SUM_f')
+                self.add_link(block, current, 1, None)
+                self.add_link(block, gain, 2, None)
+                self.add_link(gain, current)
+                continue
+            if variant == 2:
+                subsystem.subsystem(sub_size)
+            block = self.add_superblock(subsystem)
+            self.add_link(current, block)
+            current = block
+
+    def generate(self, topology: str, size: int):
+        if topology not in TOPOLOGIES:
+            raise ValueError("Неизвестная топология: {0}".format(topology))
+        getattr(self, topology)(size)
+
+    def get_content(self) -> tuple:
+        values = []
+        diagram = ET.Element('XcosDiagram', {'title': self.title})
+        model = ET.SubElement(diagram, 'mxGraphModel', {'as': 'model'})
+        self.fill_root(ET.SubElement(model, 'root'), values)
+        writer = JavaStreamWriter()
+        writer.write_list(values)
+        dictionary = writer.getvalue()
+        check_dictionary(dictionary, values)
+        return ET.tostring(diagram, encoding='utf-8', xml_declaration=True), dictionary
+
+    def fill_root(self, root, values: list):
+        root_id = self.prefix + self.root_id
+        parent_id = self.prefix + self.parent_id
+        ET.SubElement(root, 'mxCell', {'id': root_id})
+        ET.SubElement(root, 'mxCell', {'id': parent_id, 'parent': root_id})
+        for block_id, block_type, gain in self.blocks:
+            attrib = {'id': block_id, 'parent': parent_id, 'style': block_type}
+            if block_type != 'SPLIT':
+                attrib['interfaceFunctionName'] = block_type
+            block = ET.SubElement(root, self.block_tags.get(block_type, 'BasicBlock'), attrib)
+            if block_type == 'GAIN_f':
+                ET.SubElement(block, 'ScilabDouble', {'as': 'realParameters', 'position': str(len(values))})
+                values.append(gain)
+            elif block_type in Parser.port_types:
+                ET.SubElement(block, 'ScilabDouble', {'as': 'integerParameters', 'position': str(len(values))})
+                values.append(float(gain))
+            ET.SubElement(block, 'mxGeometry', {'as': 'geometry', 'x': '0', 'y': '0'})
+            if block_type == 'SUPER_f':
+                child = ET.SubElement(block, 'SuperBlockDiagram', {'as': 'child'})
+                model = ET.SubElement(child, 'mxGraphModel', {'as': 'model'})
+                self.subsystems[block_id].fill_root(ET.SubElement(model, 'root'), values)
+        inputs = {}
+        outputs = {}
+        for index, (source, target, source_ordering, target_ordering) in enumerate(self.links):
+            outputs[source] = outputs.get(source, 0) + 1
+            inputs[target] = inputs.get(target, 0) + 1
+            source_port = '{0}:out{1}'.format(source, outputs[source])
+            target_port = '{0}:in{1}'.format(target, inputs[target])
+            ET.SubElement(root, 'ExplicitOutputPort', {
+                'id': source_port,
+                'parent': source,
+                'ordering': str(source_ordering or outputs[source])
+            })
+            ET.SubElement(root, 'ExplicitInputPort', {
+                'id': target_port,
+                'parent': target,
+                'ordering': str(target_ordering or inputs[target])
+            })
+            link = ET.SubElement(root, 'ExplicitLink', {
+                'id': '{0}l{1}'.format(self.prefix, index + 1),
+                'parent': parent_id,
+                'source': source_port,
+                'target': target_port
+            })
+            ET.SubElement(link, 'mxGeometry', {'as': 'geometry'})
+
+    def write(self, model_file: str):
+        content, dictionary = self.get_content()
+        with zipfile.ZipFile(model_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(Parser.content_file, content)
+            archive.writestr(Parser.source_data_file, dictionary)
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(','):
+        block_type, _, weight = item.partition('=')
+        if block_type not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError("Неизвестный тип блока: {0}".format(block_type))
+        mix[block_type] = float(weight or 1)
+    return mix
+
+
+def main(args=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Генерация синтетических моделей Xcos")
+    arg_parser.add_argument('output', help="файл модели .zcos")
+    arg_parser.add_argument('-n', '--blocks', type=int, default=100, help="примерное число блоков")
+    arg_parser.add_argument('--topology', choices=TOPOLOGIES, default='chain', help="топология модели")
+    arg_parser.add_argument('--mix', type=parse_mix, default=None, help="веса типов блоков, например GAIN_f=3,SUM_f=1")
+    arg_parser.add_argument('--seed', type=int, default=0, help="начальное значение генератора случайных чисел")
+    options = arg_parser.parse_args(args)
+
+    logger = utils.get_logger('model_generator')
+    generator = ModelGenerator(seed=options.seed, mix=options.mix)
+    generator.generate(options.topology, options.blocks)
+    generator.write(options.output)
+    logger.info("Модель {0}: блоков {1}, связей {2}".format(options.output, len(generator), len(generator.links)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parents = {}
+        self.sizes = {}
+
+    def add(self, item):
+        if item not in self.parents:
+            self.parents[item] = item
+            self.sizes[item] = 1
+
+    def find(self, item):
+        parents = self.parents
+        while parents[item] != item:
+            parents[item] = parents[parents[item]]
+            item = parents[item]
+        return item
+
+    def union(self, first, second):
+        first = self.find(first)
+        second = self.find(second)
+        if first == second:
+            return first
+        if self.sizes[first] < self.sizes[second]:
+            first, second = second, first
+        self.parents[second] = first
+        self.sizes[first] += self.sizes[second]
+        return first
+
+
+class Net:
+    def __init__(self, name: str, width: int):
+        self.name = name
+        self.width = width
+        self.drivers = []
+        self.sinks = set()
+
+    @property
+    def driver(self):
+        return self.drivers[0] if self.drivers else None
+
+    def __str__(self):
+        return "{0} [{1}]: {2} -> {3}".format(self.name, self.width, self.driver, ', '.join(sorted(self.sinks)))
+
+
+class Netlist:
+    def __init__(self):
+        self.nets = {}
+        self.block_nets = {}
+        self.undriven = set()
+        self.unloaded = set()
+        self.multiply_driven = set()
+
+    def __contains__(self, name):
+        return name in self.nets
+
+    def __len__(self):
+        return len(self.nets)
+
+    def add_net(self, name: str, width: int) -> Net:
+        net = Net(name, width)
+        self.nets[name] = net
+        self.undriven.add(name)
+        self.unloaded.add(name)
+        return net
+
+    def remove_net(self, name: str):
+        net = self.nets.pop(name)
+        self.undriven.discard(name)
+        self.unloaded.discard(name)
+        self.multiply_driven.discard(name)
+        return net
+
+    def set_driver(self, name: str, block_id: str):
+        if name not in self.nets:
+            return
+        net = self.nets[name]
+        if block_id in net.drivers:
+            return
+        net.drivers.append(block_id)
+        self.undriven.discard(name)
+        if len(net.drivers) > 1:
+            self.multiply_driven.add(name)
+        self.block_nets.setdefault(block_id, {'inputs': [], 'output': None})['output'] = name
+
+    def add_sink(self, name: str, block_id: str):
+        nets = self.block_nets.setdefault(block_id, {'inputs': [], 'output': None})
+        nets['inputs'].append(name)
+        if name not in self.nets:
+            return
+        self.nets[name].sinks.add(block_id)
+        self.unloaded.discard(name)
+
+    def connect(self, block_id: str, inputs, output):
+        for name in (inputs if isinstance(inputs, list) else [inputs]):
+            if name is not None:
+                self.add_sink(name, block_id)
+        for name in (output if isinstance(output, list) else [output]):
+            if name is not None:
+                self.set_driver(name, block_id)
+
+    def replace(self, old: str, new: str) -> set:
+        net = self.remove_net(old)
+        for block_id in net.sinks:
+            inputs = self.block_nets[block_id]['inputs']
+            inputs[:] = [new if x == old else x for x in inputs]
+            if new in self.nets:
+                self.nets[new].sinks.add(block_id)
+                self.unloaded.discard(new)
+        return net.sinks
+
+    def get_nets(self, block_id: str) -> dict:
+        return self.block_nets.get(block_id)
@@ -0,0 +1,64 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+
+class OutputWriter:
+    def __init__(self, sink):
+        self.sink = sink
+        self.partial = []
+        self.started = False
+        self.blank = False
+
+    def write(self, chunk: str):
+        if '\n' not in chunk:
+            if chunk:
+                self.partial.append(chunk)
+            return
+        self.partial.append(chunk)
+        lines = ''.join(self.partial).split('\n')
+        self.partial = [lines.pop()]
+        self.write_lines(lines)
+
+    def write_lines(self, lines: list):
+        output = []
+        for line in lines:
+            if not line:
+                self.blank = True
+                continue
+            if self.blank:
+                output.append('')
+                self.blank = False
+            output.append(line)
+        if not output:
+            return
+        if self.started:
+            self.sink.write('\n')
+        self.sink.write('\n'.join(output))
+        self.started = True
+
+    def close(self):
+        tail = ''.join(self.partial)
+        self.partial = []
+        self.write_lines([tail] if tail else [])
+        if self.blank:
+            self.sink.write('\n' if self.started else '')
+            self.blank = False
+            self.started = True
@@ -19,119 +19,261 @@
 
 """
 
+import hashlib
+import io
 import os
-import sys
 import zipfile
+import tempfile
 import xml.etree.ElementTree as ET
-import shutil
-import subprocess
 
 from block import Block
+from build_report import BuildReport
+from dictionary_reader import DictionaryError, read_dictionary
+from errors import ModelError
+from extractor import ExtractorError, ExtractorWorker
 import utils
 
 DEBUG = False
-SCILAB_ROOT = '/home/ilia/scilab-5.5.2/'
-JAVA = '/usr/lib/jvm/jdk1.8.0_72/bin/java'
-JGRAPHX = '/home/ilia/Downloads/'
+DIGEST_ROUNDS = 4
 
 
 class Parser:
     content_file = 'content.xml'
     source_data_file = 'dictionary/dictionary.ser'
-    destination_data_file = 'data.bin'
+    block_tags = {
+        'RoundBlock': 'BasicBlock',
+        'SplitBlock': 'BasicBlock',
+        'ExplicitInBlock': 'BasicBlock',
+        'ExplicitOutBlock': 'BasicBlock'
+    }
+    block_types = ['INTEGRAL_f', 'DIFF_f', 'GAIN_f', 'SUM_f', 'SPLIT']
+    port_types = ['IN_f', 'OUT_f']
 
-    def __init__(self, model_file: str, enable_adder_optimization=True):
+    def __init__(
+        self,
+        model_file,
+        enable_adder_optimization=True,
+        extractor: ExtractorWorker = None,
+        report: BuildReport = None,
+        enable_gain_folding=True
+    ):
         self.logger = utils.get_logger(__name__)
         self.adder_optimization = enable_adder_optimization
-        self.model = self.load_model(model_file)
-        self.blocks = self.get_basic_blocks()
-        self.get_links()
-        self.simplify()
+        self.gain_folding = enable_gain_folding
+        self.extractor = extractor
+        self.report = report or BuildReport(self.get_model_name(model_file))
+        self.dictionary = None
+        self.dictionary_data = None
+        self.item_index = {}
+        self.block_index = {}
+        with self.report.phase('load'):
+            self.model = self.load_model(model_file)
+        links = self.process()
+        self.report.count('elements', len(self.model))
+        self.report.count('links', links)
+        self.report.count('blocks', len(self.blocks))
 
-    def load_model(self, model_file: str):
+    def process(self) -> int:
+        with self.report.phase('blocks'):
+            self.blocks = self.get_basic_blocks()
+        with self.report.phase('link_resolution'):
+            links = self.get_links()
+        with self.report.phase('simplify'):
+            self.simplify()
+        return links
+
+    @staticmethod
+    def get_model_name(model_file) -> str:
+        if isinstance(model_file, str):
+            return model_file
+        return getattr(model_file, 'name', '<model>')
+
+    def load_model(self, model_file):
         self.logger.info(utils.separator)
         self.logger.info("Загрузка модели...")
-        if not os.path.exists(model_file) or not os.path.isfile(model_file):
-            self.logger.error("Файл модели не найден: {0}".format(model_file))
-            sys.exit(1)
+        name = self.get_model_name(model_file)
+        if isinstance(model_file, (bytes, bytearray, memoryview)):
+            model_file = io.BytesIO(model_file)
+        elif isinstance(model_file, str) and (not os.path.exists(model_file) or not os.path.isfile(model_file)):
+            raise ModelError("Файл модели не найден: {0}".format(name))
         if not zipfile.is_zipfile(model_file):
-            self.logger.error("Файл не является xcos архивом: {0}".format(model_file))
-            sys.exit(1)
+            raise ModelError("Файл не является xcos архивом: {0}".format(name))
         with zipfile.ZipFile(model_file) as archive:
             if self.content_file not in archive.namelist() or self.source_data_file not in archive.namelist():
-                self.logger.error("В файле не найдено описание модели: {0}".format(model_file))
-                sys.exit(1)
+                raise ModelError("В файле не найдено описание модели: {0}".format(name))
             if DEBUG:
                 archive.extract(self.content_file)
-            with archive.open(self.content_file) as file:
-                raw = file.read().decode()
-                raw = raw.replace('RoundBlock', 'BasicBlock')
-                raw = raw.replace('SplitBlock', 'BasicBlock')
-                content_tree = ET.fromstring(raw)
-            archive.extract(self.source_data_file, './')
-            shutil.move(self.source_data_file, self.destination_data_file)
-            shutil.rmtree(self.source_data_file.split('/')[0])
-
-        model = content_tree[0][0]
-        self.logger.info("Модель успешно загружена: {0}".format(content_tree.attrib['title']))
+            with archive.open(self.content_file) as file, self.report.phase('xml_parse'):
+                try:
+                    title, model = self.parse_content(file)
+                except ET.ParseError as e:
+                    raise ModelError("Некорректное описание модели в {0}: {1}".format(name, e))
+            self.dictionary_data = archive.read(self.source_data_file)
+
+        if model is None:
+            raise ModelError("В файле не найдено описание модели: {0}".format(name))
+        self.logger.info("Модель успешно загружена: {0}".format(title))
         self.logger.info("Загружено компонентов модели: {0}".format(len(model)))
         return model
 
+    def parse_content(self, stream):
+        title = None
+        source = None
+        model = None
+        path = []
+        for event, element in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                element.tag = self.block_tags.get(element.tag, element.tag)
+                if not path:
+                    title = element.attrib.get('title')
+                elif len(path) == 2 and source is None and path[1] is path[0][0]:
+                    source = element
+                    model = ET.Element(element.tag, element.attrib)
+                path.append(element)
+                continue
+            path.pop()
+            if not path:
+                break
+            parent = path[-1]
+            if parent is source:
+                item = self.compact(element)
+                model.append(item)
+                if 'id' in item.attrib:
+                    self.item_index[item.attrib['id']] = item
+                parent.remove(element)
+            elif len(path) <= 2 and element is not source:
+                parent.remove(element)
+        return title, model
+
+    @classmethod
+    def compact(cls, element):
+        item = ET.Element(element.tag, element.attrib)
+        if element.tag == 'BasicBlock':
+            for child in element.iter('ScilabDouble'):
+                if child.attrib.get('as') in ['realParameters', 'integerParameters']:
+                    ET.SubElement(item, child.tag, child.attrib)
+        elif element.tag == 'SuperBlock':
+            diagram = ET.SubElement(item, 'SuperBlockDiagram')
+            root = element.find('SuperBlockDiagram/mxGraphModel/root')
+            if root is not None:
+                diagram.extend(cls.compact(x) for x in root)
+        return item
+
     def get_basic_blocks(self) -> list:
         self.logger.info(utils.separator)
         self.logger.info("Поиск базовых блоков...")
+        positions = {}
+        blocks = self.collect_blocks(positions)
+        with self.report.phase('gain_extraction'):
+            for block, value in self.extract_values(positions).items():
+                if block.block_type == 'GAIN_f':
+                    block.gain = value
+                else:
+                    block.port = int(value)
+        self.log_blocks(blocks)
+        self.dictionary_data = None
+        for block in blocks:
+            if block.subsystem:
+                block.subsystem.process()
+        return blocks
+
+    def collect_blocks(self, positions: dict) -> list:
         blocks = []
-        for item in self.model.iter('BasicBlock'):
-            block_type = item.attrib['interfaceFunctionName'] if 'interfaceFunctionName' in item.attrib else 'SPLIT'
-            block_id = item.attrib['id']
-            if block_type not in ['INTEGRAL_f', 'DIFF_f', 'GAIN_f', 'SUM_f', 'SPLIT']:
-                self.logger.error("Неивестный тип блока: {0}".format(block_type))
-                sys.exit(1)
-            block = Block(block_type, block_id)
-            if block_type == 'GAIN_f':
+        for item in self.model:
+            if item.tag == 'SuperBlock':
+                block = Block('SUPER_f', item.attrib['id'])
+                block.subsystem = SubsystemParser(self, block.block_id, item.find('SuperBlockDiagram'), positions)
+            elif item.tag == 'BasicBlock':
+                block_type = item.attrib['interfaceFunctionName'] if 'interfaceFunctionName' in item.attrib else 'SPLIT'
+                if block_type not in self.block_types:
+                    raise ModelError("Неивестный тип блока: {0}".format(block_type))
+                block = Block(block_type, item.attrib['id'])
                 for child in item.iter('ScilabDouble'):
-                    if child.attrib['as'] == 'realParameters':
-                        command = '{0} -classpath {1}:{2}:{3} Extractor {4} {5}'.format(
-                            JAVA,
-                            os.path.dirname(__file__),
-                            SCILAB_ROOT + 'share/scilab/modules/types/jar/org.scilab.modules.types.jar',
-                            JGRAPHX + 'jgraphx.jar',
-                            os.path.dirname(__file__) + '/' + self.destination_data_file,
-                            child.attrib['position']
-                        )
-                        p = subprocess.Popen(command.split(), stdout=subprocess.PIPE)
-                        result, _ = p.communicate()
-                        gain = float(result.decode().strip()[1:-1])
-                        block.gain = gain
+                    if block_type == 'GAIN_f' and child.attrib['as'] == 'realParameters':
+                        positions[block] = int(child.attrib['position'])
+                    elif block_type in self.port_types and child.attrib['as'] == 'integerParameters':
+                        positions[block] = int(child.attrib['position'])
+            else:
+                continue
+            blocks.append(block)
+            self.block_index[block.block_id] = block
+        return blocks
+
+    def log_blocks(self, blocks: list):
+        for block in blocks:
             if not block.gain:
-                self.logger.info("Тип блока: {0}, ID блока: {1}".format(block_type, block_id))
+                self.logger.info("Тип блока: %s, ID блока: %s", block.block_type, block.block_id)
             else:
-                self.logger.info("Тип блока: {0}, ID блока: {1}, коэффициент: {2}".format(
-                    block_type,
-                    block_id,
+                self.logger.info(
+                    "Тип блока: %s, ID блока: %s, коэффициент: %s",
+                    block.block_type,
+                    block.block_id,
                     block.gain
-                ))
-            blocks.append(block)
+                )
         self.logger.info("Найдено базовых блоков: {0}".format(len(blocks)))
-        os.remove(self.destination_data_file)
-        return blocks
+
+    def extract_values(self, positions: dict) -> dict:
+        if not positions:
+            return {}
+        if not self.extractor:
+            return {block: self.extract_value(position) for block, position in positions.items()}
+        self.logger.info("Извлечение {0} параметров через JVM...".format(len(positions)))
+        with tempfile.NamedTemporaryFile(prefix='xcos-gen-', suffix='.ser') as data_file:
+            data_file.write(self.dictionary_data)
+            data_file.flush()
+            try:
+                values = self.extractor.extract(data_file.name, list(positions.values()))
+            except ExtractorError as e:
+                raise ModelError("Ошибка извлечения коэффициентов: {0}".format(e))
+        result = {}
+        for block, position in positions.items():
+            try:
+                result[block] = float(values[position][1:-1])
+            except ValueError:
+                raise ModelError("Некорректное значение параметра в позиции {0}: {1}".format(
+                    position,
+                    values[position]
+                ))
+        return result
+
+    def load_dictionary(self) -> list:
+        if self.dictionary is None:
+            try:
+                self.dictionary = read_dictionary(self.dictionary_data)
+            except DictionaryError as e:
+                raise ModelError("Не удалось прочитать словарь модели: {0}".format(e))
+        return self.dictionary
+
+    def extract_value(self, position: int) -> float:
+        dictionary = self.load_dictionary()
+        if position >= len(dictionary):
+            raise ModelError("В словаре модели нет значения с позицией {0}".format(position))
+        try:
+            return float(dictionary[position].scalar())
+        except (AttributeError, DictionaryError):
+            raise ModelError("Некорректное значение параметра в позиции {0}".format(position))
 
     def find_item(self, item_id: str):
-        for item in self.model:
-            if item.attrib['id'] == item_id:
-                return item
+        return self.item_index.get(item_id)
 
     def find_block(self, block_id: str) -> Block:
-        for item in self.blocks:
-            if item.block_id == block_id:
-                return item
+        return self.block_index.get(block_id)
 
     def find_endpoints(self, link):
         source_port = self.find_item(link.attrib['source'])
         source = self.find_item(source_port.attrib['parent'])
         target_port = self.find_item(link.attrib['target'])
         target = self.find_item(target_port.attrib['parent'])
-        return source, target
+        return source, target, source_port, target_port
+
+    def connect(self, source: Block, target: Block, output_port=1, input_port=1):
+        if target.block_id in source.outputs:
+            if (source.get_output_port(target.block_id), target.get_input_port(source.block_id)) != (output_port, input_port):
+                raise ModelError("Блоки {0} и {1} соединены через несколько портов подсистемы".format(
+                    source.block_id,
+                    target.block_id
+                ))
+        source.connect(target, output_port, input_port)
 
     def simplify(self):
         self.logger.info(utils.separator)
@@ -140,49 +282,206 @@ class Parser:
         for block in self.blocks:
             if block.block_type == 'SPLIT':
                 source = self.find_block(list(block.inputs)[0])
-                source.outputs.remove(block.block_id)
-                for output in block.outputs:
+                output_port, _ = source.disconnect(block)
+                for output in list(block.outputs):
                     target = self.find_block(output)
-                    target.inputs.remove(block.block_id)
-                    source.connect(target)
+                    _, input_port = block.disconnect(target)
+                    self.connect(source, target, output_port, input_port)
                 to_remove.add(block)
             if block.block_type == 'SUM_f' and self.adder_optimization:
                 for item in list(block.inputs):
                     neighbour = self.find_block(item)
-                    if neighbour.block_type == 'SUM_f':
-                        block.inputs.remove(neighbour.block_id)
-                        for port in neighbour.inputs:
+                    if neighbour.block_type == 'SUM_f' and neighbour.outputs == {block.block_id}:
+                        neighbour.disconnect(block)
+                        for port in list(neighbour.inputs):
                             source = self.find_block(port)
-                            source.outputs.remove(neighbour.block_id)
-                            source.connect(block)
+                            output_port, _ = source.disconnect(neighbour)
+                            self.connect(source, block, output_port)
                         to_remove.add(neighbour)
-        for block in to_remove:
-            self.logger.info("Блок {0} удален: {1}".format(block.block_type, block.block_id))
-            self.blocks.remove(block)
+        self.remove_blocks(to_remove)
+        if self.gain_folding:
+            saved = self.fold_gains()
+            self.report.add('multipliers_saved', saved)
+            self.logger.info("Сэкономлено умножителей: {0}".format(saved))
+
+    def remove_blocks(self, to_remove: set):
+        for block in self.blocks:
+            if block in to_remove:
+                self.logger.info("Блок %s удален: %s", block.block_type, block.block_id)
+                del self.block_index[block.block_id]
+        self.blocks = [x for x in self.blocks if x not in to_remove]
+
+    def bypass_block(self, block: Block, source: Block, targets: list):
+        output_port, _ = source.disconnect(block)
+        for target in targets:
+            _, input_port = block.disconnect(target)
+            self.connect(source, target, output_port, input_port)
+
+    def is_single_gain(self, block: Block) -> bool:
+        return block.block_type == 'GAIN_f' and len(block.inputs) == 1 and block.block_id not in block.outputs
+
+    def fold_gains(self) -> int:
+        to_remove = set()
+        changed = True
+        while changed:
+            changed = False
+            for block in self.blocks:
+                if block in to_remove or not self.is_single_gain(block) or not block.outputs:
+                    continue
+                source = self.find_block(next(iter(block.inputs)))
+                targets = [self.find_block(x) for x in sorted(block.outputs)]
+                if source is None or None in targets:
+                    continue
+                if any(x.block_id in source.outputs for x in targets):
+                    continue
+                if block.gain == 1:
+                    self.logger.debug("Удаляю единичный коэффициент: %s", block.block_id)
+                elif all(self.is_single_gain(x) for x in targets):
+                    self.logger.debug("Переношу коэффициент %s в %s", block.block_id, ', '.join(block.outputs))
+                    for target in targets:
+                        target.gain *= block.gain
+                else:
+                    continue
+                self.bypass_block(block, source, targets)
+                to_remove.add(block)
+                changed = True
+            for block in self.blocks:
+                if block in to_remove:
+                    continue
+                groups = {}
+                for item in sorted(block.outputs):
+                    target = self.find_block(item)
+                    if target is not None and self.is_single_gain(target):
+                        groups.setdefault((target.gain, block.get_output_port(item)), []).append(target)
+                for group in groups.values():
+                    kept = group[0]
+                    for other in group[1:]:
+                        if not kept.outputs or not other.outputs or kept.outputs & other.outputs:
+                            continue
+                        self.logger.debug("Объединяю одинаковые коэффициенты: %s, %s", kept.block_id, other.block_id)
+                        block.disconnect(other)
+                        for item in sorted(other.outputs):
+                            target = self.find_block(item)
+                            _, input_port = other.disconnect(target)
+                            self.connect(kept, target, 1, input_port)
+                        to_remove.add(other)
+                        changed = True
+        self.remove_blocks(to_remove)
+        return len(to_remove)
 
     def get_links(self):
         self.logger.info(utils.separator)
         self.logger.info("Поиск связей...")
-        links = list([x for x in self.model.iter('ExplicitLink')])
-        for item in links:
-            source, target = self.find_endpoints(item)
-            self.logger.info("Связь {0}: {1} -> {2}".format(
-                item.attrib['id'],
-                source.tag,
-                target.tag
-            ))
+        links = []
+        for item in self.model.findall('ExplicitLink'):
+            endpoints = self.find_endpoints(item)
+            self.logger.info("Связь %s: %s -> %s", item.attrib['id'], endpoints[0].tag, endpoints[1].tag)
+            links.append(endpoints)
         self.logger.info(utils.separator)
         self.logger.info("Обработка связей...")
-        for item in links:
-            source, target = self.find_endpoints(item)
-            if source.tag == 'BasicBlock' and target.tag == 'BasicBlock':
-                self.connect_basic_blocks(source, target)
+        for source, target, source_port, target_port in links:
+            if source.tag in ['BasicBlock', 'SuperBlock'] and target.tag in ['BasicBlock', 'SuperBlock']:
+                self.connect_basic_blocks(source, target, source_port, target_port)
+        return len(links)
 
-    def connect_basic_blocks(self, source, target):
+    def connect_basic_blocks(self, source, target, source_port=None, target_port=None):
         source_block = self.find_block(source.attrib['id'])
         target_block = self.find_block(target.attrib['id'])
-        self.logger.info("Создаю соединение: {0} -> {1}".format(
-            source_block.block_type,
-            target_block.block_type
+        self.logger.debug("Создаю соединение: %s -> %s", source_block.block_type, target_block.block_type)
+        output_port = self.get_port_number(source_block, source_port, 'outputs')
+        input_port = self.get_port_number(target_block, target_port, 'inputs')
+        self.connect(source_block, target_block, output_port, input_port)
+
+    @staticmethod
+    def get_port_number(block: Block, port, direction: str) -> int:
+        if block.subsystem is None or port is None:
+            return 1
+        number = int(port.attrib.get('ordering', 1))
+        if not 1 <= number <= len(getattr(block.subsystem, direction)):
+            raise ModelError("У подсистемы {0} нет порта с номером {1}".format(block.block_id, number))
+        return number
+
+
+class SubsystemParser(Parser):
+    block_types = Parser.block_types + Parser.port_types
+
+    def __init__(self, parent: Parser, block_id: str, diagram, positions: dict):
+        self.logger = parent.logger
+        self.parent = parent
+        self.block_id = block_id
+        self.adder_optimization = parent.adder_optimization
+        self.gain_folding = parent.gain_folding
+        self.report = parent.report
+        self.item_index = {x.attrib['id']: x for x in diagram if 'id' in x.attrib}
+        self.block_index = {}
+        self.inputs = []
+        self.outputs = []
+        self.digest = None
+        self.model = diagram
+        self.blocks = self.collect_blocks(positions)
+
+    def process(self) -> int:
+        self.logger.info(utils.separator)
+        self.logger.info("Разбор подсистемы {0}...".format(self.block_id))
+        self.log_blocks(self.blocks)
+        for block in self.blocks:
+            if block.subsystem:
+                block.subsystem.process()
+        self.inputs = self.get_ports(self.blocks, 'IN_f')
+        self.outputs = self.get_ports(self.blocks, 'OUT_f')
+        with self.report.phase('link_resolution'):
+            links = self.get_links()
+        with self.report.phase('simplify'):
+            self.simplify()
+        self.digest = self.get_digest()
+        self.report.add('subsystems')
+        self.logger.info("Подсистема {0}: входов {1}, выходов {2}, блоков {3}".format(
+            self.block_id,
+            len(self.inputs),
+            len(self.outputs),
+            len(self.blocks)
         ))
-        source_block.connect(target_block)
+        return links
+
+    def get_ports(self, blocks: list, block_type: str) -> list:
+        ports = [x for x in blocks if x.block_type == block_type]
+        for index, block in enumerate(ports):
+            if block.port is None:
+                block.port = index + 1
+        if sorted(x.port for x in ports) != list(range(1, len(ports) + 1)):
+            raise ModelError("Некорректная нумерация портов {0} в подсистеме {1}".format(block_type, self.block_id))
+        return sorted(ports, key=lambda x: x.port)
+
+    @staticmethod
+    def get_label(block: Block) -> str:
+        return '{0}:{1!r}:{2}:{3}'.format(
+            block.block_type,
+            block.gain,
+            block.port,
+            block.subsystem.digest if block.subsystem else ''
+        )
+
+    def get_digest(self) -> str:
+        labels = {x.block_id: self.get_label(x) for x in self.blocks}
+        count = len(set(labels.values()))
+        for _ in range(DIGEST_ROUNDS):
+            labels = {x.block_id: hashlib.sha1('{0}|{1}|{2}'.format(
+                labels[x.block_id],
+                sorted((labels[y], x.get_input_port(y)) for y in x.inputs),
+                sorted((labels[y], x.get_output_port(y)) for y in x.outputs)
+            ).encode()).hexdigest() for x in self.blocks}
+            refined = len(set(labels.values()))
+            if refined == count:
+                break
+            count = refined
+        order = sorted(range(len(self.blocks)), key=lambda x: (labels[self.blocks[x].block_id], x))
+        numbers = {self.blocks[x].block_id: index for index, x in enumerate(order)}
+        lines = []
+        for index in order:
+            block = self.blocks[index]
+            edges = sorted(
+                (numbers[x], block.get_output_port(x), self.find_block(x).get_input_port(block.block_id))
+                for x in block.outputs
+            )
+            lines.append('{0} {1}'.format(self.get_label(block), edges))
+        return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
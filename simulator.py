@@ -0,0 +1,372 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import argparse
+import graphlib
+import json
+import logging
+import sys
+import time
+
+import numpy
+
+from errors import GeneratorError, ModelError, TemplateError
+from hdl_block import HdlBlock
+from parser import Parser, SubsystemParser
+from template_builder import CORES_DIR, TemplateBuilder
+import utils
+
+SAMPLES = 8192
+VECTORS = 256
+CHUNK = 64
+DT = 2 ** -8
+WINDOW = 256
+TONES = 3
+AMPLITUDE = 0.2
+FREQUENCIES = (0.05, 0.2)
+CARRY = 4
+
+logger = utils.get_logger('simulator')
+
+
+def delay(values, samples: int):
+    result = numpy.zeros_like(values)
+    if samples < values.shape[-1]:
+        result[..., samples:] = values[..., :values.shape[-1] - samples]
+    return result
+
+
+def modulate(values):
+    levels = numpy.round(numpy.cumsum(values, axis=-1))
+    steps = numpy.diff(levels, axis=-1, prepend=0)
+    overflow = (numpy.abs(steps) > 1).reshape(-1, steps.shape[-1]).any(axis=0)
+    if not overflow.any():
+        return steps
+    start = int(numpy.argmax(overflow))
+    residual = numpy.zeros(steps.shape[:-1])
+    for index in range(start, steps.shape[-1]):
+        total = residual + steps[..., index]
+        steps[..., index] = numpy.clip(total, -1, 1)
+        residual = numpy.clip(total - steps[..., index], -CARRY, CARRY)
+    return steps
+
+
+def quantize(values, bits: int):
+    scale = 2 ** (bits - 1)
+    return numpy.clip(numpy.round(values * scale), -scale, scale - 1) / scale
+
+
+def moving_average(values, window: int):
+    total = numpy.cumsum(values, axis=-1)
+    return (total - delay(total, window)) / window
+
+
+def as_list(wire) -> list:
+    if wire is None:
+        return []
+    return wire if isinstance(wire, list) else [wire]
+
+
+class Simulator:
+    def __init__(self, parser: Parser, builder: TemplateBuilder, samples=SAMPLES, dt=DT, window=WINDOW):
+        self.parser = parser
+        self.builder = builder
+        self.samples = samples
+        self.dt = dt
+        self.window = window
+        self.warmup = min(samples // 2, 4 * window)
+        self.max_latency = min(self.warmup, window)
+        self.latency = None
+        self.peaks = {}
+        self.clipped_gains = set()
+        self.orders = {}
+        self.subsystem_builders = {}
+        self.cores = {
+            'sd_mult_2in': self.run_multiplier,
+            'sd_diff': self.run_differentiator,
+            'sd_integrator': self.run_integrator,
+            'sd_adder': self.run_adder
+        }
+        if builder.multi_adder:
+            self.cores[builder.multi_adder['name']] = self.run_adder
+        self.output_wire = builder.find_output_wire()
+
+    def create_stimuli(self, count: int, seed=0):
+        generator = numpy.random.default_rng(seed)
+        times = numpy.arange(self.samples) * self.dt
+        frequencies = generator.uniform(*FREQUENCIES, size=(count, TONES, 1))
+        phases = generator.uniform(0, 2 * numpy.pi, size=(count, TONES, 1))
+        return AMPLITUDE / TONES * numpy.sin(2 * numpy.pi * frequencies * times + phases).sum(axis=1)
+
+    def get_order(self, key, graph: dict) -> list:
+        if key not in self.orders:
+            try:
+                self.orders[key] = list(graphlib.TopologicalSorter(graph).static_order())
+            except graphlib.CycleError:
+                raise ModelError("Симуляция моделей с обратными связями не поддерживается")
+        return self.orders[key]
+
+    def run_ideal(self, parser: Parser, inputs: dict) -> dict:
+        order = self.get_order(('ideal', id(parser)), {x.block_id: x.inputs for x in parser.blocks})
+        values = {}
+        for block_id in order:
+            block = parser.find_block(block_id)
+            if block.subsystem:
+                ports = {}
+                for source in block.inputs:
+                    port = block.get_input_port(source)
+                    ports[port] = ports.get(port, 0) + self.get_ideal_value(parser, values, source, block_id)
+                values[block_id] = self.run_ideal(block.subsystem, ports)
+                continue
+            if block.block_type == 'IN_f':
+                values[block_id] = inputs.get(block.port, 0)
+                continue
+            if block.inputs:
+                x = sum(self.get_ideal_value(parser, values, x, block_id) for x in sorted(block.inputs))
+            else:
+                x = inputs['in']
+            if block.block_type == 'INTEGRAL_f':
+                values[block_id] = numpy.cumsum(x, axis=-1) * self.dt
+            elif block.block_type == 'DIFF_f':
+                values[block_id] = numpy.diff(x, axis=-1, prepend=x[..., :1]) / self.dt
+            elif block.block_type == 'GAIN_f':
+                values[block_id] = block.gain * x
+            else:
+                values[block_id] = x
+            peak = float(numpy.max(numpy.abs(values[block_id])))
+            self.peaks[block_id] = max(self.peaks.get(block_id, 0), peak)
+        if isinstance(parser, SubsystemParser):
+            return {x.port: values[x.block_id] for x in parser.outputs}
+        return values
+
+    @staticmethod
+    def get_ideal_value(parser: Parser, values: dict, source_id: str, target_id: str):
+        source = parser.find_block(source_id)
+        if source.subsystem:
+            return values[source_id][source.get_output_port(target_id)]
+        return values[source_id]
+
+    def get_ideal_output(self, values: dict):
+        outputs = []
+        for block in self.parser.blocks:
+            if block.subsystem:
+                used = {block.get_output_port(x) for x in block.outputs}
+                outputs.extend(values[block.block_id][x.port] for x in block.subsystem.outputs if x.port not in used)
+            elif not block.outputs:
+                outputs.append(values[block.block_id])
+        if len(outputs) != 1:
+            raise ModelError("Невозможно выбрать выходной сигнал")
+        return outputs[0]
+
+    def get_hdl_order(self, key, hdl_blocks: list) -> list:
+        drivers = {}
+        for hdl_block in hdl_blocks:
+            for wire in as_list(hdl_block.out_wire):
+                drivers[wire] = hdl_block.block_id
+        graph = {}
+        for hdl_block in hdl_blocks:
+            graph[hdl_block.block_id] = {drivers[x] for x in as_list(hdl_block.in_wire) if x in drivers}
+        return self.get_order(('hdl', key), graph)
+
+    def run_hdl_blocks(self, key, builder: TemplateBuilder, wires: dict, keep: set):
+        uses = {}
+        for hdl_block in builder.hdl_blocks:
+            for wire in as_list(hdl_block.in_wire):
+                uses[wire] = uses.get(wire, 0) + 1
+        for block_id in self.get_hdl_order(key, builder.hdl_blocks):
+            hdl_block = builder.find_hdl_block(block_id)
+            if hdl_block.block_type in ['input_port', 'output_port']:
+                continue
+            inputs = [wires[x] for x in as_list(hdl_block.in_wire)]
+            outputs = self.run_hdl_block(hdl_block, inputs)
+            for wire, value in zip(as_list(hdl_block.out_wire), outputs):
+                wires[wire] = value
+            for wire in as_list(hdl_block.in_wire):
+                uses[wire] -= 1
+                if uses[wire] == 0 and wire not in keep:
+                    del wires[wire]
+
+    def run_hdl_block(self, hdl_block: HdlBlock, inputs: list) -> list:
+        if hdl_block.block_type == 'subsystem':
+            return self.run_subsystem(hdl_block, inputs)
+        if hdl_block.block_type not in self.cores:
+            raise TemplateError("Нет модели ядра для симуляции: {0}".format(hdl_block.block_type))
+        return [self.cores[hdl_block.block_type](hdl_block, inputs)]
+
+    def run_subsystem(self, hdl_block: HdlBlock, inputs: list) -> list:
+        digest = hdl_block.subsystem.digest
+        if digest not in self.subsystem_builders:
+            builder = self.builder.create_subsystem_builder()
+            builder.prepare_subsystem(hdl_block.subsystem)
+            self.subsystem_builders[digest] = builder
+        builder = self.subsystem_builders[digest]
+        wires = {'in_{0}'.format(index + 1): value for index, value in enumerate(inputs)}
+        outputs = [x for x in builder.hdl_blocks if x.block_type == 'output_port']
+        outputs.sort(key=lambda x: x.port)
+        self.run_hdl_blocks(digest, builder, wires, {x.in_wire for x in outputs})
+        return [wires[x.in_wire] for x in outputs]
+
+    def run_multiplier(self, hdl_block: HdlBlock, inputs: list):
+        params = self.builder.multiplier_params
+        fraction = params['N'] - 1 - params['intN']
+        limit = 2 ** params['intN']
+        gain = numpy.clip(numpy.round(hdl_block.gain * 2 ** fraction) / 2 ** fraction, -limit, limit - 2 ** -fraction)
+        if abs(gain - hdl_block.gain) > 2 ** -fraction:
+            self.clipped_gains.add(hdl_block.block_id)
+        return modulate(gain * inputs[0])
+
+    def run_differentiator(self, hdl_block: HdlBlock, inputs: list):
+        window = 2 ** self.builder.differentiator_params['k']
+        average = moving_average(inputs[0], window)
+        return modulate((average - delay(average, window)) / (window * self.dt))
+
+    def run_integrator(self, hdl_block: HdlBlock, inputs: list):
+        return modulate(numpy.cumsum(inputs[0], axis=-1) * self.dt)
+
+    def run_adder(self, hdl_block: HdlBlock, inputs: list):
+        multi_adder = self.builder.multi_adder
+        if len(inputs) > 2 and multi_adder and len(inputs) <= multi_adder['max_inputs']:
+            return modulate(sum(inputs))
+        while len(inputs) > 2:
+            level = [modulate(inputs[x] + inputs[x + 1]) for x in range(0, len(inputs) - 1, 2)]
+            if len(inputs) % 2:
+                level.append(inputs[-1])
+            inputs = level
+        return modulate(inputs[0] + inputs[1])
+
+    def run_netlist(self, stimuli):
+        module_ports = self.builder.module_ports
+        if module_ports['module_input']['type'] == 'normal':
+            stimuli = quantize(stimuli, module_ports['module_input']['width'])
+        wires = {self.builder.input_wire: modulate(stimuli)}
+        self.run_hdl_blocks(None, self.builder, wires, {self.output_wire})
+        output = moving_average(wires[self.output_wire], self.window)
+        if module_ports['module_output']['type'] == 'normal':
+            output = quantize(output, module_ports['module_output']['width'])
+        return output
+
+    def get_delayed(self, values, latency: int):
+        return values[:, self.warmup - latency:self.samples - latency]
+
+    def find_latency(self, output, ideal) -> int:
+        errors = [numpy.mean((output - self.get_delayed(ideal, x)) ** 2) for x in range(self.max_latency + 1)]
+        return int(numpy.argmin(errors))
+
+    def compare(self, stimuli) -> tuple:
+        ideal = moving_average(self.get_ideal_output(self.run_ideal(self.parser, {'in': stimuli})), self.window)
+        output = self.run_netlist(stimuli)[:, self.warmup:]
+        if self.latency is None:
+            self.latency = self.find_latency(output, ideal)
+            logger.info("Задержка схемы относительно модели: {0} отсчетов".format(self.latency))
+        ideal = self.get_delayed(ideal, self.latency)
+        error = output - ideal
+        scale = numpy.sqrt(numpy.mean(ideal ** 2, axis=-1))
+        return numpy.sqrt(numpy.mean(error ** 2, axis=-1)), numpy.max(numpy.abs(error), axis=-1), scale
+
+    def run(self, vectors=VECTORS, seed=0, chunk=CHUNK) -> dict:
+        logger.info(utils.separator)
+        logger.info("Симуляция: {0} векторов по {1} отсчетов".format(vectors, self.samples))
+        started = time.perf_counter()
+        rms = []
+        peak = []
+        scale = []
+        for offset in range(0, vectors, chunk):
+            stimuli = self.create_stimuli(min(chunk, vectors - offset), seed + offset)
+            result = self.compare(stimuli)
+            rms.append(result[0])
+            peak.append(result[1])
+            scale.append(result[2])
+        rms = numpy.concatenate(rms)
+        peak = numpy.concatenate(peak)
+        scale = numpy.concatenate(scale)
+        elapsed = time.perf_counter() - started
+        logger.info("Симуляция завершена за {0:.3f} с".format(elapsed))
+        saturated = sorted(x for x, peak in self.peaks.items() if peak > 1)
+        if self.clipped_gains:
+            logger.warning("Коэффициенты вне диапазона умножителя: {0}".format(', '.join(sorted(self.clipped_gains))))
+        if saturated:
+            logger.warning("Идеальный сигнал выходит за диапазон [-1, 1] в блоках: {0} (максимум {1:.3f})".format(
+                len(saturated),
+                max(self.peaks.values())
+            ))
+        return {
+            'vectors': vectors,
+            'samples': self.samples,
+            'dt': self.dt,
+            'window': self.window,
+            'latency': self.latency,
+            'time': round(elapsed, 6),
+            'rms_error': float(numpy.mean(rms)),
+            'worst_rms_error': float(numpy.max(rms)),
+            'max_error': float(numpy.max(peak)),
+            'signal_rms': float(numpy.mean(scale)),
+            'worst_vector': int(numpy.argmax(rms)),
+            'peak_level': max(self.peaks.values(), default=0),
+            'saturated_blocks': saturated,
+            'clipped_gains': sorted(self.clipped_gains)
+        }
+
+
+def main(args=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Симуляция сигма-дельта схемы, созданной из модели Xcos")
+    arg_parser.add_argument('-m', '--model', default='./model.zcos', help="файл модели .zcos")
+    arg_parser.add_argument('-t', '--template', default='default.template', help="файл шаблона")
+    arg_parser.add_argument('--cores-dir', default=CORES_DIR, help="каталог библиотеки ядер HDL")
+    arg_parser.add_argument('--no-gain-folding', action='store_true', help="не сворачивать цепочки коэффициентов усиления")
+    arg_parser.add_argument('-n', '--vectors', type=int, default=VECTORS, help="число тестовых векторов")
+    arg_parser.add_argument('--samples', type=int, default=SAMPLES, help="число отсчетов в векторе")
+    arg_parser.add_argument('--dt', type=float, default=DT, help="шаг по времени на один отсчет")
+    arg_parser.add_argument('--window', type=int, default=WINDOW, help="окно усреднения демодулятора")
+    arg_parser.add_argument('--seed', type=int, default=0, help="начальное значение генератора случайных чисел")
+    arg_parser.add_argument('--tolerance', type=float, help="допустимая среднеквадратичная ошибка")
+    arg_parser.add_argument('-o', '--output', help="сохранить результат в формате JSON")
+    arg_parser.add_argument('--log-level', choices=sorted(utils.log_levels), default='warning', help="уровень журнала")
+    options = arg_parser.parse_args(args)
+    utils.set_log_level(options.log_level)
+    logger.setLevel(min(utils.log_level, logging.INFO))
+
+    try:
+        parser = Parser(options.model, False, enable_gain_folding=not options.no_gain_folding)
+        builder = TemplateBuilder(options.template, options.cores_dir)
+        builder.build(parser)
+        simulator = Simulator(parser, builder, options.samples, options.dt, options.window)
+        result = simulator.run(options.vectors, options.seed)
+    except GeneratorError as e:
+        logger.error(e)
+        return 1
+    logger.info("Среднеквадратичная ошибка: {0:.6f} (худший вектор {1}: {2:.6f}), максимальная: {3:.6f}".format(
+        result['rms_error'],
+        result['worst_vector'],
+        result['worst_rms_error'],
+        result['max_error']
+    ))
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(result, file, ensure_ascii=False, indent=4)
+            file.write('\n')
+    if options.tolerance is not None and result['worst_rms_error'] > options.tolerance:
+        logger.error("Ошибка превышает допустимую: {0}".format(options.tolerance))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,32 +19,81 @@
 
 """
 
+import copy
 import datetime
+import io
 import os
 import shlex
-import sys
 
 import utils
+from build_report import BuildReport
+from compiled_template import CompiledTemplate
+from core_library import CoreLibrary
+from errors import ModelError, TemplateError
 from hdl_block import HdlBlock
+from netlist import DisjointSet, Netlist
+from output_writer import OutputWriter
 from parser import Parser
-from safe_dict import SafeDict
 
-CORES_DIR = '/home/ilia/src/sc_cores'
+CORES_DIR = os.environ.get('XCOS_GEN_CORES', '/home/ilia/src/sc_cores')
+
+compiled_templates = {}
 
 
 class TemplateBuilder:
-    def __init__(self, filename: str):
+    multi_input_blocks = ['sd_adder']
+    local_blocks = {
+        'SUPER_f': 'subsystem',
+        'IN_f': 'input_port',
+        'OUT_f': 'output_port'
+    }
+    adder_params = {
+        'bin': 0,
+        'N': 3
+    }
+    multiplier_params = {
+        'N': 16,
+        'outN': 2,
+        'intN': 0,
+        'bin': 0
+    }
+    differentiator_params = {
+        'N': 15,
+        'k': 5,
+        'bin': 0
+    }
+    integrator_params = {
+        'N': 31,
+        'Nmod': '31 + 1',
+        'bin': 1,
+        'doWin': 0,
+        'doSrst': 0,
+        'doRVin': 0,
+        'doEn': 0
+    }
+
+    def __init__(self, filename: str, cores_dir=CORES_DIR):
         self.logger = utils.get_logger(__name__)
+        self.cores = CoreLibrary.open(cores_dir)
+        self.core_modules = {}
+        self.validated = set()
+        self.port_widths = {}
         self.assoc = {}
         self.module_name = 'regulator'
         self.template = ''
-        self.body = ''
+        self.compiled = None
+        self.sections = {}
+        self.sources = []
+        self.body = []
+        self.wire_fragments = {}
         self.block_ids = {}
         self.wire_id = 0
-        self.removed_wires = []
+        self.netlist = Netlist()
         self.param_wire_id = 0
         self.param_wires = []
+        self.param_wire_index = {}
         self.module_params = []
+        self.multi_adder = None
         self.module_ports = {
             'module_input': {
                 'type': 'sigma-delta',
@@ -56,28 +105,76 @@ class TemplateBuilder:
             }
         }
         self.hdl_blocks = []
+        self.report = BuildReport()
+        self.hdl_index = {}
+        self.fragments = {}
+        self.input_wire = None
+        self.subsystems = {}
+        self.subsystem_modules = {}
         self.creation_date = datetime.datetime.now()
         self.preprocess(filename)
-        self.fill_module_info()
+
+    def clone(self):
+        builder = copy.deepcopy(self)
+        builder.creation_date = datetime.datetime.now()
+        return builder
 
     def preprocess(self, filename: str):
         self.logger.info(utils.separator)
         self.logger.info("Запускаю обработку шаблона...")
         if not os.path.exists(filename):
-            self.logger.error("Файл шаблона не найден: {0}".format(filename))
-            sys.exit(1)
+            raise TemplateError("Файл шаблона не найден: {0}".format(filename))
+        key = (os.getcwd(), os.path.abspath(filename), self.cores.directory)
+        cached = compiled_templates.get(key)
+        if cached and cached['mtimes'] == self.get_mtimes(cached['sources']):
+            self.logger.info("Использую ранее скомпилированный шаблон")
+            self.load_snapshot(cached)
+            return
+        self.sources.append(filename)
         with open(filename) as file:
             for line in file.readlines():
                 self.parse(line)
         self.template += '\n'
+        self.compiled = CompiledTemplate(self.template)
+        compiled_templates[key] = self.get_snapshot()
+
+    @staticmethod
+    def get_mtimes(sources: list) -> list:
+        try:
+            return [os.path.getmtime(x) for x in sources]
+        except OSError:
+            return None
+
+    def get_snapshot(self) -> dict:
+        return copy.deepcopy({
+            'mtimes': self.get_mtimes(self.sources),
+            'sources': self.sources,
+            'template': self.template,
+            'compiled': self.compiled,
+            'assoc': self.assoc,
+            'module_name': self.module_name,
+            'module_params': self.module_params,
+            'module_ports': self.module_ports,
+            'multi_adder': self.multi_adder
+        })
+
+    def load_snapshot(self, snapshot: dict):
+        snapshot = copy.deepcopy(snapshot)
+        self.sources = snapshot['sources']
+        self.template = snapshot['template']
+        self.compiled = snapshot['compiled']
+        self.assoc = snapshot['assoc']
+        self.module_name = snapshot['module_name']
+        self.module_params = snapshot['module_params']
+        self.module_ports = snapshot['module_ports']
+        self.multi_adder = snapshot['multi_adder']
 
     def parse(self, line: str):
         line = line.strip()
         if line.startswith(';') or not line:
             return
         if not line.startswith(':'):
-            self.logger.error("Некорректный синтаксис в шаблоне: {0}".format(line))
-            sys.exit(1)
+            raise TemplateError("Некорректный синтаксис в шаблоне: {0}".format(line))
         split = shlex.split(line)
         commands = {
             'include': lambda: self.include(split[1]),
@@ -88,53 +185,65 @@ class TemplateBuilder:
             'param': lambda: self.create_param(split[1], split[2]),
             'module_input': lambda: self.set_module_port(command, split),
             'module_output': lambda: self.set_module_port(command, split),
-            'name': lambda: self.set_module_name(split[1])
+            'name': lambda: self.set_module_name(split[1]),
+            'multi_adder': lambda: self.set_multi_adder(split[1], split[2] if len(split) > 2 else 64)
         }
         command = split[0][1:]
         if command not in commands:
-            self.logger.error("Некорректный синтаксис в шаблоне: {0}".format(line))
-            sys.exit(1)
+            raise TemplateError("Некорректный синтаксис в шаблоне: {0}".format(line))
         commands[command]()
 
     def include(self, part: str):
         self.logger.info("Выполняю импорт {0}".format(part))
         filename = '{0}.part'.format(part)
         if not os.path.exists(filename):
-            self.logger.error("Файл для импорта не найден: {0}".format(filename))
-            sys.exit(1)
+            raise TemplateError("Файл для импорта не найден: {0}".format(filename))
+        self.sources.append(filename)
         with open(filename) as file:
             self.template += file.read()
 
     def create_association(self, source: str, target: str):
         self.logger.info("Создаю ассоциацию {0} -> {1}".format(source, target))
-        filename = '{0}/{1}/hdl/{1}.v'.format(CORES_DIR, target)
-        if not filename:
-            self.logger.error("Не могу найти модуль HDL: {0}".format(filename))
-            sys.exit(1)
+        filename = self.cores.get_path(target)
+        if self.cores.available and not os.path.isfile(filename):
+            raise TemplateError("Не могу найти модуль HDL: {0}".format(filename))
         self.assoc[source] = {
             'name': target,
             'path': filename
         }
 
     def build(self, parser: Parser):
+        self.report = parser.report
+        with self.report.phase('hdl_reconnection'):
+            self.input_wire = self.prepare(parser)
+        with self.report.phase('rendering'):
+            self.render_blocks(self.input_wire)
+        self.fill_module_info()
+        self.report.count('wires', self.wire_id)
+        self.report.count('param_wires', len(self.param_wires))
+        self.report.count('instances', sum(self.report.instances.values()))
+        if self.subsystem_modules:
+            self.report.count('subsystem_modules', len(self.subsystem_modules))
+        self.cores.save()
+        self.logger.info(utils.separator)
+        self.logger.info("Сборка шаблона завершена")
+
+    def prepare(self, parser: Parser) -> str:
         self.logger.info(utils.separator)
         self.logger.info("Запускаю сборку шаблона...")
-        self.template = self.template.format(**SafeDict({
+        self.sections.update({
             'module_name': self.module_name,
             'module_params': self.get_module_params(),
             'module_ports': self.get_module_ports()
-        }))
+        })
         blocks = parser.blocks
         entrance_count = 0
         for block in blocks:
-            if block.block_type not in self.assoc:
-                self.logger.error("Не найдена ассоциация для блока: {0}".format(block.block_type))
-                sys.exit(1)
+            self.get_hdl_type(block.block_type)
             if len(block.inputs) == 0:
                 entrance_count += 1
         if entrance_count > 1:
-            self.logger.error("В модели более 1 блока без входов. Невозможно выбрать начальный блок")
-            sys.exit(1)
+            raise ModelError("В модели более 1 блока без входов. Невозможно выбрать начальный блок")
         in_wire = 'in'
         if self.module_ports['module_input']['type'] == 'normal':
             self.logger.info("Добавляю сигма-дельта модулятор")
@@ -151,12 +260,29 @@ class TemplateBuilder:
                 'y': in_wire
             }
             self.place_hdl_block('sd_modulator', params, ports)
-            self.body += '\n'
-        for block in parser.blocks:
-            self.hdl_blocks.append(HdlBlock(block, self.assoc[block.block_type]['name']))
+            self.netlist.set_driver(in_wire, 'sd_modulator')
+            self.body.append('\n')
+        self.add_hdl_blocks(parser.blocks)
         self.reconnect_hdl_blocks()
-        self.find_input_wire(in_wire, in_wire != 'in')
-        self.body += '\n\n'
+        self.connect_netlist()
+        self.find_input_wire(in_wire)
+        return in_wire
+
+    def get_hdl_type(self, block_type: str) -> str:
+        if block_type in self.local_blocks:
+            return self.local_blocks[block_type]
+        if block_type not in self.assoc:
+            raise TemplateError("Не найдена ассоциация для блока: {0}".format(block_type))
+        return self.assoc[block_type]['name']
+
+    def add_hdl_blocks(self, blocks: list):
+        for block in blocks:
+            hdl_block = HdlBlock(block, self.get_hdl_type(block.block_type))
+            self.hdl_blocks.append(hdl_block)
+            self.hdl_index[hdl_block.block_id] = hdl_block
+
+    def render_blocks(self, in_wire: str):
+        self.body.append('\n\n')
         self.logger.info(utils.separator)
         self.logger.info("Запускаю генерацию блоков HDL")
         for hdl_block in self.hdl_blocks:
@@ -172,13 +298,10 @@ class TemplateBuilder:
                 'y': 'out'
             }
             self.place_hdl_block('sd_av_demodulator', params, ports)
-            self.body += '\n'
-        self.template = self.template.format(**SafeDict({'body': self.body}))
+            self.body.append('\n')
+        self.sections['body'] = self.body
         self.place_param_wires()
         self.place_params_assign()
-        self.prettify()
-        self.logger.info(utils.separator)
-        self.logger.info("Сборка шаблона завершена")
 
     def place_block(self, name):
         self.template += '{{{0}}}\n'.format(name)
@@ -199,8 +322,7 @@ class TemplateBuilder:
         }
         port_type = value[1]
         if port_type not in ['sigma-delta', 'normal']:
-            self.logger.error("Неверный тип сигнала '{0}': {1}".format(name, port_type))
-            sys.exit(1)
+            raise TemplateError("Неверный тип сигнала '{0}': {1}".format(name, port_type))
         port_width = 2 if port_type == 'sigma-delta' else int(value[2])
         self.logger.info("Задаю тип сигнала на {0}е модуля: {1} шириной {2} бит".format(
             printable[name],
@@ -213,11 +335,31 @@ class TemplateBuilder:
         }
 
     def fill_module_info(self):
-        self.template = self.template.format(**SafeDict({
+        self.sections.update({
             'creation_date': self.creation_date.strftime('%d.%m.%Y / %H:%M:%S'),
-            'time_spent': (datetime.datetime.now() - self.creation_date).microseconds,
-            'used_cores': ', '.join([x['name'] for x in self.assoc.values()])
-        }))
+            'used_cores': ', '.join([x['name'] for x in self.get_used_cores()])
+        })
+
+    def get_used_cores(self, instances=None) -> list:
+        if instances is None:
+            instances = self.report.instances
+        cores = list(self.assoc.values())
+        if self.multi_adder:
+            cores.append(self.multi_adder)
+        used = {}
+        for core in cores:
+            if core['name'] in instances:
+                used.setdefault(core['name'], core)
+        return list(used.values())
+
+    def get_core_sources(self, instances=None) -> list:
+        if instances is None:
+            instances = self.report.instances
+        paths = [x['path'] for x in self.get_used_cores(instances)]
+        for name in ['sd_modulator', 'sd_av_demodulator']:
+            if name in instances:
+                paths.append(self.cores.get_path(name))
+        return list(dict.fromkeys(paths))
 
     def set_module_name(self, name: str):
         self.logger.info("Задаю имя модуля HDL как {0}".format(name))
@@ -270,23 +412,73 @@ class TemplateBuilder:
             'sd_adder': lambda: self.create_adder(hdl_block),
             'sd_mult_2in': lambda: self.create_multiplier(hdl_block),
             'sd_diff': lambda: self.create_differentiator(hdl_block),
-            'sd_integrator': lambda: self.create_integrator(hdl_block)
+            'sd_integrator': lambda: self.create_integrator(hdl_block),
+            'subsystem': lambda: self.create_subsystem(hdl_block),
+            'input_port': lambda: None,
+            'output_port': lambda: self.create_output_port(hdl_block)
         }
         if hdl_block.block_type in hdl_block_types:
+            self.fragments[hdl_block.block_id] = len(self.body)
             hdl_block_types[hdl_block.block_type]()
         else:
-            self.logger.error("Неизвестен рецепт для генерации: {0}".format(hdl_block.block_type))
-            sys.exit(1)
+            raise TemplateError("Неизвестен рецепт для генерации: {0}".format(hdl_block.block_type))
+
+    def get_core_module(self, name: str):
+        if name not in self.core_modules:
+            module = self.cores.get(name)
+            if module is None:
+                raise TemplateError("Не найден модуль HDL {0}: {1}".format(name, self.cores.get_path(name)))
+            self.core_modules[name] = module
+        return self.core_modules[name]
+
+    def get_signal_width(self, signal):
+        if signal in self.netlist:
+            return self.netlist.nets[signal].width
+        if signal == 'in':
+            return self.module_ports['module_input']['width']
+        if signal == 'out':
+            return self.module_ports['module_output']['width']
+        return None
 
-    def place_hdl_block(self, name: str, params: dict, ports: dict):
+    def validate_hdl_block(self, name: str, params: dict, ports: dict):
+        if not self.cores.available or name in self.subsystem_modules:
+            return
+        module = self.get_core_module(name)
+        signature = (name, tuple(params), tuple(ports))
+        if signature not in self.validated:
+            errors = module.validate(params, ports)
+            if errors:
+                raise TemplateError("Некорректное подключение ядра {0}: {1}".format(name, ', '.join(errors)))
+            self.validated.add(signature)
+        for port, signal in ports.items():
+            width = self.get_signal_width(signal)
+            if width is None:
+                continue
+            key = (name, port, tuple(params.items()))
+            if key not in self.port_widths:
+                self.port_widths[key] = module.get_width(port, params)
+            if self.port_widths[key] not in (None, width):
+                self.logger.warning(
+                    "Ширина порта %s.%s (%s) не совпадает с шириной сигнала %s (%s)",
+                    name,
+                    port,
+                    self.port_widths[key],
+                    signal,
+                    width
+                )
+
+    def place_hdl_block(self, name: str, params: dict, ports: dict, instance_name=None):
         ports['clk'] = 'clk'
         ports['rst'] = 'rst'
-        if name in self.block_ids:
-            self.block_ids[name] += 1
-        else:
-            self.block_ids[name] = 0
-        instance_name = '{0}_{1}'.format(name, self.block_ids[name])
-        self.logger.info("Создаю блок {0}".format(name))
+        self.validate_hdl_block(name, params, ports)
+        if instance_name is None:
+            if name in self.block_ids:
+                self.block_ids[name] += 1
+            else:
+                self.block_ids[name] = 0
+            instance_name = '{0}_{1}'.format(name, self.block_ids[name])
+            self.report.count_instance(name)
+        self.logger.info("Создаю блок %s", name)
         printable = '    ' + name
         template = '        .{0}({1})'
         if params:
@@ -294,119 +486,217 @@ class TemplateBuilder:
             printable += ' #(\n{0}\n    )'.format(printable_params)
         printable_ports = ',\n'.join(template.format(key, ports[key]) for key in ports.keys())
         printable += ' {0} (\n{1}\n    );'.format(instance_name, printable_ports)
-        self.body += printable + '\n\n'
+        self.body.append(printable + '\n\n')
+        return instance_name
 
     def place_wire(self, width=2):
         name = 'wire_{0}'.format(self.wire_id)
         self.wire_id += 1
-        self.logger.info("Добавляю провод: {0}".format(name))
-        self.body += '    wire [{0}:0] {1};\n'.format(width - 1, name)
+        self.netlist.add_net(name, width)
+        self.logger.info("Добавляю провод: %s", name)
+        self.wire_fragments[name] = len(self.body)
+        self.body.append('    wire [{0}:0] {1};\n'.format(width - 1, name))
         return name
 
     def find_hdl_block(self, block_id: str) -> HdlBlock:
-        for block in self.hdl_blocks:
-            if block.block_id == block_id:
-                return block
-        return None
+        return self.hdl_index.get(block_id)
 
-    def find_input_wire(self, replace_wire: str, ignore_first=False):
+    def find_input_wire(self, replace_wire: str):
         self.logger.info(utils.separator)
         self.logger.info("Выполняю переподключение входного сигнала...")
-        start_index = 1 if ignore_first else 0
-        wires = ['wire_{0}'.format(x) for x in range(start_index, self.wire_id)]
-        for hdl_block in self.hdl_blocks:
-            if hdl_block.out_wire in wires:
-                wires.remove(hdl_block.out_wire)
-        if not wires or len(wires) > 1:
-            self.logger.error("Невозможно выбрать входной сигнал")
-            sys.exit(1)
-        model_input_wire = wires[0]
-        self.removed_wires.append(model_input_wire)
+        if len(self.netlist.undriven) != 1:
+            raise ModelError("Невозможно выбрать входной сигнал")
+        model_input_wire = next(iter(self.netlist.undriven))
         self.logger.info("Входной сигнал модели: {0}".format(model_input_wire))
+        self.replace_wire(model_input_wire, replace_wire)
+
+    def replace_wire(self, old_wire: str, new_wire: str):
+        for block_id in sorted(self.netlist.replace(old_wire, new_wire)):
+            hdl_block = self.hdl_index[block_id]
+            self.logger.info("Замена входного сигнала для %s на %s", hdl_block.block_type, new_wire)
+            if isinstance(hdl_block.in_wire, list):
+                hdl_block.in_wire = [new_wire if x == old_wire else x for x in hdl_block.in_wire]
+            else:
+                hdl_block.in_wire = new_wire
+        if old_wire in self.wire_fragments:
+            self.logger.info("Сигнал {0} был удален".format(old_wire))
+            self.body[self.wire_fragments.pop(old_wire)] = ''
+
+    def connect_netlist(self):
         for hdl_block in self.hdl_blocks:
-            if hdl_block.in_wire == model_input_wire:
-                self.logger.info("Замена входного сигнала для {0} на {1}".format(hdl_block.block_type, replace_wire))
-                hdl_block.in_wire = replace_wire
-                break
-        lines = self.body.splitlines()
-        for i in range(0, len(lines)):
-            if model_input_wire in lines[i]:
-                self.logger.info("Сигнал {0} был удален".format(model_input_wire))
-                lines.remove(lines[i])
-                self.body = '\n'.join(lines)
-                break
+            self.netlist.connect(hdl_block.block_id, hdl_block.in_wire, hdl_block.out_wire)
+        if self.netlist.multiply_driven:
+            raise ModelError("Сигналы с несколькими источниками: {0}".format(
+                ', '.join(sorted(self.netlist.multiply_driven))
+            ))
 
     def reconnect_hdl_blocks(self):
         self.logger.info(utils.separator)
         self.logger.info("Выполняю создание соединений...")
-        for hdl_block in self.hdl_blocks:
-            for source in hdl_block.inputs:
-                source_block = self.find_hdl_block(source)
-                if source_block.out_wire:
-                    if hdl_block.block_type != 'sd_adder':
-                        hdl_block.in_wire = source_block.out_wire
-                        break
-                    else:
-                        if not hdl_block.in_wire:
-                            hdl_block.in_wire = []
-                            hdl_block.in_wire.append(source_block.out_wire)
-            if not hdl_block.in_wire:
-                hdl_block.in_wire = self.place_wire()
-                for source in hdl_block.inputs:
-                    source_block = self.find_hdl_block(source)
-                    source_block.out_wire = hdl_block.in_wire
-            for target in hdl_block.outputs:
+        hdl_blocks = sorted(self.hdl_blocks, key=lambda x: x.block_id)
+        ports = DisjointSet()
+        input_indexes = {}
+        for hdl_block in hdl_blocks:
+            if hdl_block.block_type in self.multi_input_blocks:
+                input_indexes[hdl_block.block_id] = {x: i for i, x in enumerate(sorted(hdl_block.inputs))}
+            for port in self.get_output_ports(hdl_block) + self.get_input_ports(hdl_block):
+                ports.add(port)
+        for hdl_block in hdl_blocks:
+            for target in sorted(hdl_block.outputs):
                 target_block = self.find_hdl_block(target)
-                if target_block.in_wire and target_block.block_type != 'sd_adder':
-                    hdl_block.out_wire = target_block.in_wire
-                    break
-            if not hdl_block.out_wire:
-                hdl_block.out_wire = self.place_wire()
-                for target in hdl_block.outputs:
-                    target_block = self.find_hdl_block(target)
-                    if target_block.block_type != 'sd_adder':
-                        target_block.in_wire = hdl_block.out_wire
-                    else:
-                        if not target_block.in_wire:
-                            target_block.in_wire = []
-                        target_block.in_wire.append(hdl_block.out_wire)
+                ports.union(
+                    self.get_output_port(hdl_block, target),
+                    self.get_input_port(target_block, hdl_block.block_id, input_indexes)
+                )
+        wires = {}
+        for hdl_block in hdl_blocks:
+            in_wires = [self.get_port_wire(ports.find(x), wires) for x in self.get_input_ports(hdl_block)]
+            out_wires = [self.get_port_wire(ports.find(x), wires) for x in self.get_output_ports(hdl_block)]
+            if hdl_block.block_type == 'subsystem':
+                hdl_block.in_wire = in_wires
+                hdl_block.out_wire = out_wires
+                continue
+            if hdl_block.block_type in self.multi_input_blocks:
+                hdl_block.in_wire = in_wires
+            else:
+                hdl_block.in_wire = in_wires[0] if in_wires else None
+            hdl_block.out_wire = out_wires[0] if out_wires else None
+
+    def get_port_wire(self, root, wires: dict) -> str:
+        if root not in wires:
+            wires[root] = self.place_wire()
+        return wires[root]
+
+    @staticmethod
+    def get_output_ports(hdl_block: HdlBlock) -> list:
+        if hdl_block.block_type == 'subsystem':
+            return [(hdl_block.block_id, 'out', i + 1) for i in range(len(hdl_block.subsystem.outputs))]
+        if hdl_block.block_type == 'output_port':
+            return []
+        return [(hdl_block.block_id, 'out')]
+
+    @staticmethod
+    def get_output_port(hdl_block: HdlBlock, target_id: str) -> tuple:
+        if hdl_block.block_type == 'subsystem':
+            return hdl_block.block_id, 'out', hdl_block.output_ports.get(target_id, 1)
+        return hdl_block.block_id, 'out'
+
+    def get_input_ports(self, hdl_block: HdlBlock) -> list:
+        if hdl_block.block_type == 'subsystem':
+            return [(hdl_block.block_id, 'in', i + 1) for i in range(len(hdl_block.subsystem.inputs))]
+        if hdl_block.block_type == 'input_port':
+            return []
+        if hdl_block.block_type not in self.multi_input_blocks:
+            return [(hdl_block.block_id, 'in', 0)]
+        return [(hdl_block.block_id, 'in', i) for i in range(len(hdl_block.inputs))]
+
+    def get_input_port(self, hdl_block: HdlBlock, source_id: str, input_indexes: dict) -> tuple:
+        if hdl_block.block_type == 'subsystem':
+            return hdl_block.block_id, 'in', hdl_block.input_ports.get(source_id, 1)
+        if hdl_block.block_type not in self.multi_input_blocks:
+            return hdl_block.block_id, 'in', 0
+        return hdl_block.block_id, 'in', input_indexes[hdl_block.block_id][source_id]
 
     def create_adder(self, hdl_block: HdlBlock):
-        if len(hdl_block.inputs) > 2:
-            self.logger.error("В данной версии не поддерживаются сумматоры с числом входов > 2")
-            sys.exit(1)
-        params = {
-            'bin': 0,
-            'N': 3
-        }
+        inputs = list(hdl_block.in_wire)
+        if len(inputs) < 2:
+            raise ModelError("Сумматор {0} должен иметь не менее 2 входов".format(hdl_block.block_id))
+        if len(inputs) > 2 and self.multi_adder and len(inputs) <= self.multi_adder['max_inputs']:
+            self.logger.info("Создаю сумматор на %s входов", len(inputs))
+            params = dict(self.adder_params, M=len(inputs))
+            ports = {
+                'x': '{{{0}}}'.format(', '.join(reversed(inputs))),
+                's': hdl_block.out_wire
+            }
+            self.place_hdl_block(self.multi_adder['name'], params, ports)
+            return
+        if len(inputs) > 2:
+            self.logger.info("Создаю дерево сумматоров на %s входов", len(inputs))
+        internal_wires = set()
+        while len(inputs) > 2:
+            level = []
+            for i in range(0, len(inputs) - 1, 2):
+                wire = self.place_wire()
+                self.place_adder(inputs[i], inputs[i + 1], wire, internal_wires)
+                internal_wires.add(wire)
+                level.append(wire)
+            if len(inputs) % 2:
+                level.append(inputs[-1])
+            inputs = level
+        self.place_adder(inputs[0], inputs[1], hdl_block.out_wire, internal_wires)
+
+    def place_adder(self, x: str, y: str, s: str, internal_wires: set):
+        params = dict(self.adder_params)
         ports = {
-            'x': hdl_block.in_wire[0],
-            'y': hdl_block.in_wire[1],
-            's': hdl_block.out_wire
+            'x': x,
+            'y': y,
+            's': s
+        }
+        instance_name = self.place_hdl_block('sd_adder', params, ports)
+        for wire in [x, y]:
+            if wire in internal_wires:
+                self.netlist.add_sink(wire, instance_name)
+        if s in self.netlist and not self.netlist.nets[s].drivers:
+            self.netlist.set_driver(s, instance_name)
+
+    def set_multi_adder(self, name: str, max_inputs: str):
+        self.logger.info("Использую {0} для сумматоров до {1} входов".format(name, max_inputs))
+        path = self.cores.get_path(name)
+        if self.cores.available and not os.path.isfile(path):
+            raise TemplateError("Не могу найти модуль HDL: {0}".format(path))
+        self.multi_adder = {
+            'name': name,
+            'path': path,
+            'max_inputs': int(max_inputs)
         }
-        self.place_hdl_block(hdl_block.block_type, params, ports)
 
     def create_multiplier(self, hdl_block: HdlBlock):
-        params = {
-            'N': 16,
-            'outN': 2,
-            'intN': 0,
-            'bin': 0
-        }
+        params = dict(self.multiplier_params)
         ports = {
             'x': hdl_block.in_wire,
-            'kp': self.create_param_wire(16, hdl_block.gain),
-            'kn': self.create_param_wire(16, -hdl_block.gain),
+            'kp': self.create_param_wire(params['N'], hdl_block.gain),
+            'kn': self.create_param_wire(params['N'], -hdl_block.gain),
             'y': hdl_block.out_wire
         }
-        self.place_hdl_block(hdl_block.block_type, params, ports)
+        hdl_block.instance_name = self.place_hdl_block(hdl_block.block_type, params, ports, hdl_block.instance_name)
+
+    def update_gains(self, blocks: list) -> list:
+        changed = set()
+        for block in blocks:
+            hdl_block = self.find_hdl_block(block.block_id)
+            if hdl_block.gain != block.gain:
+                hdl_block.gain = block.gain
+                changed.add(hdl_block.block_id)
+        if not changed:
+            return []
+        self.logger.info(utils.separator)
+        self.logger.info("Обновляю коэффициенты усиления: {0}".format(len(changed)))
+        width = self.multiplier_params['N']
+        previous = self.param_wire_index
+        self.param_wire_id = 0
+        self.param_wires = []
+        self.param_wire_index = {}
+        affected = []
+        for hdl_block in self.hdl_blocks:
+            if hdl_block.block_type != 'sd_mult_2in':
+                continue
+            keys = [(width, str(hdl_block.gain)), (width, str(-hdl_block.gain))]
+            self.create_param_wire(width, hdl_block.gain)
+            self.create_param_wire(width, -hdl_block.gain)
+            if hdl_block.block_id in changed or any(previous.get(x) != self.param_wire_index[x] for x in keys):
+                affected.append(hdl_block)
+        body = self.body
+        for hdl_block in affected:
+            self.body = []
+            self.create_multiplier(hdl_block)
+            body[self.fragments[hdl_block.block_id]] = ''.join(self.body)
+        self.body = body
+        self.place_param_wires()
+        self.place_params_assign()
+        return affected
 
     def create_differentiator(self, hdl_block: HdlBlock):
-        params = {
-            'N': 15,
-            'k': 5,
-            'bin': 0
-        }
+        params = dict(self.differentiator_params)
         ports = {
             'x': hdl_block.in_wire,
             'y': hdl_block.out_wire,
@@ -415,15 +705,7 @@ class TemplateBuilder:
         self.place_hdl_block(hdl_block.block_type, params, ports)
 
     def create_integrator(self, hdl_block: HdlBlock):
-        params = {
-            'N': 31,
-            'Nmod': '31 + 1',
-            'bin': 1,
-            'doWin': 0,
-            'doSrst': 0,
-            'doRVin': 0,
-            'doEn': 0
-        }
+        params = dict(self.integrator_params)
         # TODO: Узнать о необходимости удаления pcm_y
         ports = {
             'w': 0,
@@ -437,47 +719,124 @@ class TemplateBuilder:
         }
         self.place_hdl_block(hdl_block.block_type, params, ports)
 
-    def prettify(self):
+    def create_subsystem(self, hdl_block: HdlBlock):
+        name = self.build_subsystem(hdl_block.subsystem)
+        ports = {}
+        for index, wire in enumerate(hdl_block.in_wire):
+            ports['in_{0}'.format(index + 1)] = wire
+        for index, wire in enumerate(hdl_block.out_wire):
+            ports['out_{0}'.format(index + 1)] = wire
+        self.place_hdl_block(name, {}, ports)
+
+    def create_output_port(self, hdl_block: HdlBlock):
+        self.body.append('    assign out_{0} = {1};\n'.format(hdl_block.port, hdl_block.in_wire))
+
+    def build_subsystem(self, subsystem) -> str:
+        if subsystem.digest in self.subsystems:
+            return self.subsystems[subsystem.digest]
+        name = '{0}_sub_{1}'.format(self.module_name, subsystem.digest[:12])
+        self.logger.info(utils.separator)
+        self.logger.info("Создаю модуль подсистемы {0}".format(name))
+        builder = self.create_subsystem_builder()
+        self.subsystem_modules[name] = builder.render_subsystem(name, subsystem)
+        self.subsystems[subsystem.digest] = name
+        self.logger.info("Модуль подсистемы {0} создан".format(name))
+        return name
+
+    def create_subsystem_builder(self):
+        builder = copy.copy(self)
+        builder.sections = {}
+        builder.body = []
+        builder.wire_fragments = {}
+        builder.block_ids = {}
+        builder.wire_id = 0
+        builder.netlist = Netlist()
+        builder.param_wire_id = 0
+        builder.param_wires = []
+        builder.param_wire_index = {}
+        builder.hdl_blocks = []
+        builder.hdl_index = {}
+        return builder
+
+    def prepare_subsystem(self, subsystem):
+        self.add_hdl_blocks(subsystem.blocks)
+        self.reconnect_hdl_blocks()
+        self.connect_netlist()
+        for hdl_block in self.hdl_blocks:
+            if hdl_block.block_type == 'input_port':
+                port = 'in_{0}'.format(hdl_block.port)
+                self.replace_wire(hdl_block.out_wire, port)
+                hdl_block.out_wire = port
+
+    def render_subsystem(self, name: str, subsystem) -> str:
+        self.prepare_subsystem(subsystem)
+        self.body.append('\n')
+        for hdl_block in self.hdl_blocks:
+            self.create_hdl_block(hdl_block)
+        self.place_param_wires()
+        self.place_params_assign()
+        ports = [
+            {
+                'type': 'input',
+                'name': 'clk'
+            },
+            {
+                'type': 'input',
+                'name': 'rst'
+            }
+        ]
+        for block in subsystem.inputs:
+            ports.append({'type': 'input', 'name': 'in_{0}'.format(block.port), 'width': 2})
+        for block in subsystem.outputs:
+            ports.append({'type': 'output', 'name': 'out_{0}'.format(block.port), 'width': 2})
+        return 'module {0} (\n{1}\n);\n\n{2}\n{3}\n{4}\nendmodule\n'.format(
+            name,
+            ',\n'.join(self.get_printable_port(port) for port in ports),
+            self.sections['param_wires'],
+            self.sections['assign'],
+            ''.join(self.body)
+        )
+
+    def write(self, sink):
         self.logger.info(utils.separator)
-        self.logger.info("Вношу косметические изменения...")
-        to_remove = []
-        lines = self.template.splitlines()
-        for i in range(0, len(lines) - 1):
-            if not lines[i] and not lines[i + 1]:
-                to_remove.append(i)
-        self.template = '\n'.join(lines[x] for x in range(0, len(lines)) if x not in to_remove)
+        self.logger.info("Записываю результат с косметическими изменениями...")
+        with self.report.phase('write'):
+            time_spent = datetime.datetime.now() - self.creation_date
+            self.sections['time_spent'] = int(time_spent.total_seconds() * 1000)
+            writer = OutputWriter(sink)
+            for chunk in self.compiled.iter_render(self.sections):
+                writer.write(chunk)
+            for text in self.subsystem_modules.values():
+                writer.write('\n\n' + text)
+            writer.close()
+
+    def render(self) -> str:
+        output = io.StringIO()
+        self.write(output)
+        return output.getvalue()
 
     def find_output_wire(self):
         self.logger.info(utils.separator)
         self.logger.info("Выполняю переподключение выходного сигнала...")
-        wires = ['wire_{0}'.format(x) for x in range(0, self.wire_id)]
-        for hdl_block in self.hdl_blocks:
-            if isinstance(hdl_block.in_wire, list):
-                for i in hdl_block.in_wire:
-                    if i in wires:
-                        wires.remove(i)
-            else:
-                if hdl_block.in_wire in wires:
-                    wires.remove(hdl_block.in_wire)
-        for i in self.removed_wires:
-            if i in wires:
-                wires.remove(i)
-        if not wires or len(wires) > 1:
-            self.logger.error("Невозможно выбрать выходной сигнал")
-            sys.exit(1)
-        model_output_wire = wires[0]
+        if len(self.netlist.unloaded) != 1:
+            raise ModelError("Невозможно выбрать выходной сигнал")
+        model_output_wire = next(iter(self.netlist.unloaded))
         self.logger.info("Выходной сигнал модели: {0}".format(model_output_wire))
         return model_output_wire
 
     def create_param_wire(self, width, value):
+        key = (width, str(value))
+        if key in self.param_wire_index:
+            return self.param_wire_index[key]
         name = 'param_wire_{0}'.format(self.param_wire_id)
-        self.logger.info("Создаю wire-параметр {0} со значением {1}".format(name, value))
+        self.logger.info("Создаю wire-параметр %s со значением %s", name, value)
         self.param_wires.append({
             'name': name,
             'width': width,
             'value': value
         })
         self.param_wire_id += 1
+        self.param_wire_index[key] = name
         return name
 
     def place_param_wires(self):
@@ -486,7 +845,7 @@ class TemplateBuilder:
         printable = ''
         for param_wire in self.param_wires:
             printable += '    wire [{0}:0] {1};\n'.format(param_wire['width'] - 1, param_wire['name'])
-        self.template = self.template.format(**SafeDict({'param_wires': printable}))
+        self.sections['param_wires'] = printable
 
     def place_params_assign(self):
         self.logger.info(utils.separator)
@@ -494,4 +853,4 @@ class TemplateBuilder:
         printable = ''
         for param_wire in self.param_wires:
             printable += '    assign {0} = {1};\n'.format(param_wire['name'], param_wire['value'])
-        self.template = self.template.format(**SafeDict({'assign': printable}))
+        self.sections['assign'] = printable
@@ -27,15 +27,35 @@ __author__ = 'Ilia Novikov <ilia.novikov@live.ru>'
 separator = '-------------------------------'
 
 
+log_level = logging.DEBUG
+log_levels = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR
+}
+loggers = set()
+
+
 def get_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(log_level)
+    if name in loggers:
+        return logger
     formatter = logging.Formatter(
         fmt='xcos-gen::{0} %(levelname)s @ [%(asctime)s] %(message)s'.format(name),
         datefmt='%d-%m-%Y / %H:%M:%S'
     )
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.DEBUG)
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
+    loggers.add(name)
     return logger
+
+
+def set_log_level(level):
+    global log_level
+    log_level = log_levels[level] if isinstance(level, str) else level
+    for name in loggers:
+        logging.getLogger(name).setLevel(log_level)
@@ -0,0 +1,192 @@
+"""
+
+    This file is part of xcos-gen.
+
+    xcos-gen is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    xcos-gen is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with xcos-gen. If not, see <http://www.gnu.org/licenses/>.
+
+    Author: Ilia Novikov <ilia.novikov@live.ru>
+
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from errors import GeneratorError
+from parser import Parser
+from template_builder import CORES_DIR, TemplateBuilder
+import utils
+
+INTERVAL = 0.5
+VOLATILE_SECTIONS = ['creation_date', 'time_spent']
+
+logger = utils.get_logger('watch')
+
+
+def get_structure(blocks: list) -> list:
+    return [
+        (
+            x.block_id,
+            x.block_type,
+            sorted(x.inputs),
+            sorted(x.outputs),
+            sorted(x.input_ports.items()),
+            sorted(x.output_ports.items()),
+            x.subsystem.digest if x.subsystem else None
+        )
+        for x in blocks
+    ]
+
+
+def get_stamps(files: list) -> dict:
+    stamps = {}
+    for filename in files:
+        try:
+            stat = os.stat(filename)
+            stamps[filename] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            stamps[filename] = None
+    return stamps
+
+
+class Watcher:
+    def __init__(
+        self,
+        model_file: str,
+        template='default.template',
+        output_file='output.v',
+        cores_dir=CORES_DIR,
+        enable_gain_folding=True
+    ):
+        self.model_file = model_file
+        self.template = template
+        self.output_file = output_file
+        self.cores_dir = cores_dir
+        self.gain_folding = enable_gain_folding
+        self.builder = None
+        self.structure = None
+        self.snapshot = None
+        self.model_stamp = None
+        self.template_stamps = None
+
+    def get_template_files(self) -> list:
+        return self.builder.sources if self.builder else [self.template]
+
+    def poll(self) -> bool:
+        model_stamp = get_stamps([self.model_file])
+        template_stamps = get_stamps(self.get_template_files())
+        if model_stamp == self.model_stamp and template_stamps == self.template_stamps:
+            return False
+        template_changed = template_stamps != self.template_stamps
+        self.model_stamp = model_stamp
+        self.template_stamps = template_stamps
+        try:
+            self.update(template_changed)
+        except GeneratorError as e:
+            logger.error(e)
+        return True
+
+    def update(self, template_changed=True):
+        started = time.perf_counter()
+        creation_date = datetime.datetime.now()
+        parser = Parser(self.model_file, False, enable_gain_folding=self.gain_folding)
+        structure = get_structure(parser.blocks)
+        if self.builder is None or template_changed or structure != self.structure:
+            builder = TemplateBuilder(self.template, self.cores_dir)
+            builder.creation_date = creation_date
+            builder.build(parser)
+            self.builder = builder
+            self.structure = structure
+            self.template_stamps = get_stamps(builder.sources)
+            message = "Полная пересборка"
+        else:
+            self.builder.creation_date = creation_date
+            self.builder.fill_module_info()
+            affected = self.builder.update_gains(parser.blocks)
+            message = "Пересобрано блоков: {0}".format(len(affected))
+        snapshot = self.get_snapshot()
+        if snapshot == self.snapshot and os.path.exists(self.output_file):
+            logger.info("{0}, результат не изменился ({1:.1f} мс)".format(
+                message,
+                (time.perf_counter() - started) * 1000
+            ))
+            return False
+        self.write()
+        self.snapshot = snapshot
+        logger.info("{0}, записан {1} ({2:.1f} мс)".format(
+            message,
+            self.output_file,
+            (time.perf_counter() - started) * 1000
+        ))
+        return True
+
+    def get_snapshot(self) -> tuple:
+        sections = {
+            key: ''.join(value) if isinstance(value, list) else value
+            for key, value in self.builder.sections.items()
+            if key not in VOLATILE_SECTIONS
+        }
+        return self.builder.template, sections, list(self.builder.subsystem_modules.values())
+
+    def write(self):
+        directory = os.path.dirname(os.path.abspath(self.output_file))
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as file:
+                self.builder.write(file)
+            os.replace(temp_path, self.output_file)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def run(self, interval=INTERVAL):
+        logger.info("Отслеживаю изменения {0} и {1}".format(self.model_file, self.template))
+        while True:
+            self.poll()
+            time.sleep(interval)
+
+
+def main(args=None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Пересборка HDL при изменении модели Xcos или шаблона")
+    arg_parser.add_argument('-m', '--model', default='./model.zcos', help="файл модели .zcos")
+    arg_parser.add_argument('-t', '--template', default='default.template', help="файл шаблона")
+    arg_parser.add_argument('--cores-dir', default=CORES_DIR, help="каталог библиотеки ядер HDL")
+    arg_parser.add_argument('-o', '--output', default='output.v', help="файл результата")
+    arg_parser.add_argument('--no-gain-folding', action='store_true', help="не сворачивать цепочки коэффициентов усиления")
+    arg_parser.add_argument('--interval', type=float, default=INTERVAL, help="период опроса файлов, с")
+    arg_parser.add_argument('--log-level', choices=sorted(utils.log_levels), default='warning', help="уровень журнала")
+    options = arg_parser.parse_args(args)
+    utils.set_log_level(options.log_level)
+    logger.setLevel(min(utils.log_level, logging.INFO))
+
+    watcher = Watcher(
+        options.model,
+        options.template,
+        options.output,
+        options.cores_dir,
+        not options.no_gain_folding
+    )
+    try:
+        watcher.run(options.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())